@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Compare DataService.load_transactions in ORM mode and bulk mode on a
+synthetic statement file.
+
+    python benchmarks/bench_load_transactions.py --rows 100000
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from ctrack.data_service import DataService, BULK_BATCH_SIZE
+from synthetic import write_statement, write_matchers
+
+
+def time_load(work_dir, csv_path, bulk, batch_size):
+    ops_dir = work_dir / ("bulk" if bulk else "orm")
+    ops_dir.mkdir()
+    dataservice = DataService(ops_dir)
+    dataservice.load_matcher_file(work_dir / "matcher_map.csv")
+    start = time.perf_counter()
+    dataservice.load_transactions(csv_path, bulk=bulk, batch_size=batch_size)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument('--rules', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        csv_path = work_dir / "statement.csv"
+        write_statement(csv_path, args.rows, args.rules, seed=1)
+        write_matchers(work_dir / "matcher_map.csv", args.rules, accounts=50)
+        orm = time_load(work_dir, csv_path, False, args.batch_size)
+        bulk = time_load(work_dir, csv_path, True, args.batch_size)
+    print(f"rows={args.rows} batch_size={args.batch_size}")
+    print(f"orm  {orm:8.3f}s")
+    print(f"bulk {bulk:8.3f}s  ({orm / bulk:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Time the import-to-post pipeline on a synthetic data set and write the
+results as JSON, so runs on different commits can be compared.
+
+    python benchmarks/bench_pipeline.py --files 4 --rows 10000 --output bench.json
+
+Each statement file is loaded, then for the whole data set the data needs
+and per-file save readiness are checked, the files are standardized and
+finally posted to the GnuCash book. Steps that do not change anything are
+repeated --repeat times, loading and posting run once per file.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from ctrack.flow import MainFlow
+from synthetic import generate
+
+
+class Timings:
+
+    def __init__(self):
+        self.steps = {}
+
+    def time(self, name, func, *args, rows=0, **kwargs):
+        start = time.perf_counter()
+        res = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        step = self.steps.setdefault(name, dict(seconds=[], rows=0))
+        step['seconds'].append(elapsed)
+        step['rows'] += rows
+        return res
+
+    def summary(self):
+        res = {}
+        for name, step in self.steps.items():
+            seconds = step['seconds']
+            res[name] = dict(calls=len(seconds),
+                             total=sum(seconds),
+                             min=min(seconds),
+                             median=statistics.median(seconds),
+                             max=max(seconds),
+                             rows=step['rows'])
+            if step['rows']:
+                res[name]['rows_per_second'] = step['rows'] / sum(seconds)
+        return res
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(work_dir, files, rows, rules, accounts, repeat, bulk):
+    data = generate(work_dir / "data", files, rows, rules, accounts)
+    timings = Timings()
+    (work_dir / "ops").mkdir()
+    flow = MainFlow(work_dir / "ops", data['gnucash_file'])
+    dataservice = flow.dataservice
+    timings.time("load_matcher_file", flow.load_matcher_rules_file, data['matcher_file'],
+                 rows=rules + 1)
+
+    file_recs = []
+    for path in data['statements']:
+        file_recs.append(timings.time("load_transactions", dataservice.load_transactions,
+                                      path, bulk=bulk, rows=rows))
+
+    for index in range(repeat):
+        needs = timings.time("get_data_needs", flow.get_data_needs)
+        if needs:
+            raise Exception(f"synthetic data set is not complete, needs {needs}")
+        for file_rec in file_recs:
+            if not timings.time("is_save_ready", file_rec.is_save_ready, rows=rows):
+                raise Exception(f"{file_rec.import_source_file} is not save ready")
+            timings.time("standardize_transactions", dataservice.standardize_transactions,
+                         file_rec, include_payments=True,
+                         payments_account=data['payments_account'], rows=rows)
+
+    for file_rec in file_recs:
+        timings.time("do_cc_transactions", dataservice.do_cc_transactions, file_rec,
+                     data['cc_account'], True, data['payments_account'], rows=rows)
+    return timings.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--rules', type=int, default=200)
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--orm', action='store_true', help="load with the ORM instead of bulk inserts")
+    parser.add_argument('--output', default="bench_pipeline.json")
+    args = parser.parse_args()
+
+    params = dict(files=args.files, rows=args.rows, rules=args.rules,
+                  accounts=args.accounts, repeat=args.repeat, bulk=not args.orm)
+    with tempfile.TemporaryDirectory() as tmp:
+        steps = run(Path(tmp), args.files, args.rows, args.rules, args.accounts,
+                    args.repeat, not args.orm)
+    result = dict(commit=git_commit(),
+                  timestamp=datetime.now().isoformat(timespec='seconds'),
+                  python=platform.python_version(),
+                  platform=platform.platform(),
+                  params=params,
+                  steps=steps)
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    for name, step in steps.items():
+        print(f"{name:26s} calls={step['calls']:4d} median={step['median']:9.4f}s "
+              f"total={step['total']:9.3f}s")
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
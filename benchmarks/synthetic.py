@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Generate a synthetic ctrack data set: statement CSVs, a matcher rules
+file and a GnuCash book holding every account the rules refer to, so a
+freshly loaded data set is save ready.
+
+    python benchmarks/synthetic.py OUT_DIR --files 4 --rows 10000 --rules 200
+"""
+import argparse
+import csv
+import random
+import warnings
+from decimal import Decimal
+from pathlib import Path
+
+from piecash import create_book, Account
+from sqlalchemy import exc as sa_exc
+
+HEADER = ["Posted Date", "Reference Number", "Payee", "Address", "Amount"]
+PAYMENT_DESC = "PAYMENT THANK YOU"
+PAYMENTS_ACCOUNT = "Assets:Checking"
+CC_ACCOUNT = "Liabilities:BenchCard"
+
+
+def merchant_names(rules):
+    return [f"MERCHANT{index:05d}" for index in range(rules)]
+
+
+def rule_account(index, accounts):
+    return f"Expenses:bench:cat{index % accounts:03d}"
+
+
+def write_matchers(path, rules, accounts):
+    """
+    One rule per merchant plus one for payments, spread over accounts
+    expense accounts.
+    """
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["cc_desc_re", "re_no_case", "account_path"])
+        for index, name in enumerate(merchant_names(rules)):
+            writer.writerow([f"^{name.lower()}\\b", "True", rule_account(index, accounts)])
+        writer.writerow([f"^{PAYMENT_DESC.lower()}", "True", rule_account(rules, accounts)])
+
+
+def write_statement(path, rows, rules, seed, payment_every=500):
+    """
+    A statement of rows charges against random merchants, with a payment
+    every payment_every rows. Returns the sum of the amounts.
+    """
+    rand = random.Random(seed)
+    names = merchant_names(rules)
+    total = Decimal(0)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for index in range(rows):
+            if payment_every and index % payment_every == payment_every - 1:
+                desc = PAYMENT_DESC
+                amount = Decimal(rand.randint(10000, 500000)) / 100
+            else:
+                desc = f"{rand.choice(names)} {rand.randint(100, 999)}-555-0100 TX"
+                amount = -Decimal(rand.randint(1, 50000)) / 100
+            total += amount
+            date = f"{index % 12 + 1:02d}/{index % 28 + 1:02d}/{2020 + seed % 5}"
+            writer.writerow([date, f"{seed:04d}{index:09d}", desc, "", f"{amount:.2f}"])
+    return total
+
+
+def write_book(path, rules, accounts):
+    """
+    A GnuCash book with the credit card and payments accounts and every
+    expense account write_matchers refers to.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=sa_exc.SAWarning)
+        book = create_book(str(path), currency="USD", overwrite=True)
+    usd = book.default_currency
+    root = book.root_account
+    parents = {}
+
+    def make(fullname, acc_type):
+        parent = root
+        parts = fullname.split(':')
+        for depth in range(1, len(parts) + 1):
+            name = ':'.join(parts[:depth])
+            if name not in parents:
+                parents[name] = Account(name=parts[depth - 1], type=acc_type,
+                                        parent=parent, commodity=usd)
+            parent = parents[name]
+
+    make(CC_ACCOUNT, "LIABILITY")
+    make(PAYMENTS_ACCOUNT, "ASSET")
+    for index in range(min(accounts, rules + 1)):
+        make(rule_account(index, accounts), "EXPENSE")
+    book.save()
+    book.close()
+
+
+def generate(out_dir, files=1, rows=10000, rules=200, accounts=50):
+    """
+    Write the data set into out_dir and return a dict describing it.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    write_matchers(out_dir / "matcher_map.csv", rules, accounts)
+    write_book(out_dir / "bench.gnucash", rules, accounts)
+    statements = []
+    for index in range(files):
+        path = out_dir / f"statement_{index:03d}.csv"
+        write_statement(path, rows, rules, seed=index)
+        statements.append(path)
+    return dict(matcher_file=out_dir / "matcher_map.csv",
+                gnucash_file=out_dir / "bench.gnucash",
+                statements=statements,
+                cc_account=CC_ACCOUNT,
+                payments_account=PAYMENTS_ACCOUNT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('out_dir')
+    parser.add_argument('--files', type=int, default=1)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--rules', type=int, default=200)
+    parser.add_argument('--accounts', type=int, default=50)
+    args = parser.parse_args()
+    generate(args.out_dir, args.files, args.rows, args.rules, args.accounts)
+
+
+if __name__ == "__main__":
+    main()
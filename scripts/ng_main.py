@@ -3,14 +3,22 @@ import argparse
 from pathlib import Path
 from typing import Optional
 
-from nicegui import events, ui
+from nicegui import app, events, ui
+from fastapi.responses import PlainTextResponse
 from ctrack.data_service import DataService
+from ctrack.metrics import metrics
 
 
-def main(data_dir, web_mode, gnucash_path):
+def main(data_dir, web_mode, gnucash_path, with_metrics=False):
     if data_dir is None:
         raise Exception('no picker for datadir yet')
 
+    if with_metrics:
+        metrics.enable()
+        @app.get('/metrics', response_class=PlainTextResponse)
+        def metrics_text():
+            return metrics.render_text()
+
     ui_app = None
     @ui.page('/')
     async def index():
@@ -36,9 +44,12 @@ if __name__ in {"__main__", "__mp_main__"}:
                        help="Path to data directory for database and working files")
     parser.add_argument('-g', '--gnucash', type=str, default=None,
                        help="Path to GnuCash database file")
+    parser.add_argument('-m', '--metrics', action='store_true',
+                       help="Record operation timings, shown on the Performance page and at /metrics")
 
     args = parser.parse_args()
     main(data_dir=args.data_dir,
          web_mode=args.web_page,
-         gnucash_path=args.gnucash
+         gnucash_path=args.gnucash,
+         with_metrics=args.metrics
          )
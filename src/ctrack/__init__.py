@@ -0,0 +1,8 @@
+def main():
+    """
+    Entry point of the ctrack script. The CLI module is only imported
+    here so that importing the package stays cheap.
+    """
+    import sys
+    from ctrack.cli import main as cli_main
+    sys.exit(cli_main())
@@ -0,0 +1,84 @@
+"""
+Async facades over DataService and MainFlow for the NiceGUI handlers.
+
+Calls run on a bounded thread pool so SQL and piecash work never blocks
+the event loop. Methods that change the database or the GnuCash book are
+also serialized through one asyncio.Lock, so only one write runs at a
+time while reads carry on alongside it.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads available to the facades of one AsyncRunner.
+ASYNC_WORKERS = 4
+
+
+class AsyncRunner:
+
+    def __init__(self, max_workers=ASYNC_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ctrack")
+        self.write_lock = asyncio.Lock()
+
+    async def read(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def write(self, func, *args, **kwargs):
+        async with self.write_lock:
+            return await self.read(func, *args, **kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsyncFacade:
+    """
+    Wraps target so each of its methods becomes a coroutine function run
+    by the runner, as a write if named in write_methods. Other attributes
+    are passed through unchanged.
+    """
+
+    write_methods = frozenset()
+
+    def __init__(self, target, runner):
+        self.target = target
+        self.runner = runner
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+        run = self.runner.write if name in self.write_methods else self.runner.read
+
+        async def call(*args, **kwargs):
+            return await run(attr, *args, **kwargs)
+        call.__name__ = name
+        return call
+
+
+class AsyncDataService(AsyncFacade):
+
+    write_methods = frozenset({
+        "set_gnucash_file", "load_gnucash_file", "sync_gnucash_accounts", "load_accounts",
+        "add_column_map", "add_account", "save_account", "update_gnucash_accounts",
+        "load_matcher_file", "add_matcher", "match_unmatched_transactions",
+        "update_transaction_matcher",
+        "add_unmapped_transaction_file", "load_transactions", "reload_transactions",
+        "import_transaction_file", "remap_transactions", "import_directory",
+        "store_parsed_file",
+        "do_cc_transactions", "post_transaction_files", "mark_files_saved",
+        "mark_accounts_in_gnucash",
+    })
+
+
+class AsyncMainFlow(AsyncFacade):
+
+    write_methods = frozenset({
+        "set_gnucash", "add_xaction_file", "add_xaction_dir", "add_column_map",
+        "add_matcher_rule", "add_account", "load_matcher_rules_file", "save_xactions",
+    })
+
+    def __init__(self, main_flow, runner):
+        super().__init__(main_flow, runner)
+        self.dataservice = AsyncDataService(main_flow.dataservice, runner)
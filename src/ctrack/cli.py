@@ -0,0 +1,160 @@
+"""
+Headless command line interface, installed as the ctrack script.
+
+    ctrack -d DATA_DIR status
+    ctrack -d DATA_DIR import statements/ [--pattern '*.csv']
+    ctrack -d DATA_DIR rematch [--matchers matcher_map.csv]
+    ctrack -d DATA_DIR export --output-dir out/
+    ctrack -d DATA_DIR post --cc-account Liabilities:MC1 --payments-account Assets:Checking
+
+Only what a command needs is imported. piecash is loaded only when the
+book is read or written (-g, post), and nothing here loads nicegui.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def open_flow(args):
+    from ctrack.flow import MainFlow
+    return MainFlow(args.data_dir, args.gnucash)
+
+
+def cmd_status(args):
+    flow = open_flow(args)
+    dataservice = flow.dataservice
+    status = dataservice.get_status()
+    needs = sorted(str(need) for need in flow.get_data_needs(status))
+    if args.json:
+        print(json.dumps(dict(gnucash_file=dataservice.gnucash_path and str(dataservice.gnucash_path),
+                              pending_files=status.pending_files,
+                              unmapped_files=status.unmapped_files,
+                              files_with_unmatched=status.files_with_unmatched,
+                              matched_rows=status.matched_rows,
+                              unmatched_rows=status.unmatched_rows,
+                              missing_accounts=status.missing_accounts,
+                              unsynced_accounts=status.unsynced_accounts,
+                              needs=needs,
+                              next_step=str(flow.get_next_step())), indent=2))
+        return 0
+    print(f"GnuCash file:          {dataservice.gnucash_path}")
+    print(f"Pending files:         {status.pending_files} "
+          f"({status.unmapped_files} unmapped, {status.files_with_unmatched} with unmatched rows)")
+    print(f"Rows:                  {status.matched_rows} matched, {status.unmatched_rows} unmatched")
+    print(f"Missing accounts:      {', '.join(status.missing_accounts) or '-'}")
+    print(f"Accounts not in book:  {', '.join(status.unsynced_accounts) or '-'}")
+    print(f"Needs:                 {', '.join(needs) or '-'}")
+    print(f"Next step:             {flow.get_next_step()}")
+    return 0
+
+
+def cmd_import(args):
+    flow = open_flow(args)
+    dataservice = flow.dataservice
+    failed = 0
+    for path in args.paths:
+        path = Path(path)
+        if path.is_dir():
+            for result in dataservice.import_directory(path, args.pattern, args.workers,
+                                                       args.external_id):
+                if result.error is not None:
+                    failed += 1
+                    print(f"{result.path}: {result.error}", file=sys.stderr)
+                else:
+                    print(f"{result.path}: file {result.file_rec.id}")
+        else:
+            file_rec = dataservice.load_transactions(path, args.external_id, bulk=args.bulk)
+            print(f"{path}: file {file_rec.id}")
+    return 1 if failed else 0
+
+
+def cmd_rematch(args):
+    flow = open_flow(args)
+    dataservice = flow.dataservice
+    if args.matchers:
+        rules = dataservice.load_matcher_file(args.matchers)
+        print(f"Added {len(rules)} matcher rules")
+    count = dataservice.match_unmatched_transactions()
+    print(f"Matched {count} transactions")
+    return 0
+
+
+def cmd_export(args):
+    flow = open_flow(args)
+    dataservice = flow.dataservice
+    if args.include_payments and args.payments_account is None:
+        raise Exception("--payments-account is required with --include-payments")
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    files = dataservice.get_transaction_files(unsaved_only=not args.all)
+    if args.file_id:
+        files = [f for f in files if f.id in args.file_id]
+    for file_rec in files:
+        output_path = output_dir / f"{Path(file_rec.import_source_file).stem}_standard.csv"
+        rows = dataservice.standardize_transactions(file_rec, output_path, args.include_payments,
+                                                    args.payments_account)
+        print(f"{file_rec.import_source_file}: {len(rows)} rows to {output_path}")
+    return 0
+
+
+def cmd_post(args):
+    flow = open_flow(args)
+    if flow.gnucash_path is None:
+        raise Exception("no GnuCash file set, give one with --gnucash")
+    deltas = flow.save_xactions(args.cc_account, args.payments_account)
+    if not deltas:
+        print("No save ready files")
+    for file_id, file_deltas in deltas.items():
+        print(f"file {file_id}:")
+        for name, delta in sorted(file_deltas.items()):
+            print(f"    {name:40s} {delta:>12}")
+    return 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="ctrack", description="Credit card transaction tracker")
+    parser.add_argument('-d', '--data-dir', type=str, default=".",
+                        help="Path to data directory for database and working files")
+    parser.add_argument('-g', '--gnucash', type=str, default=None,
+                        help="Path to GnuCash database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    status = commands.add_parser('status', help="Show pending work and the next step")
+    status.add_argument('--json', action='store_true', help="Print the status as JSON")
+    status.set_defaults(func=cmd_status)
+
+    imp = commands.add_parser('import', help="Import statement files or directories of them")
+    imp.add_argument('paths', nargs='+')
+    imp.add_argument('--pattern', default="*.csv", help="File pattern for directories")
+    imp.add_argument('--workers', type=int, default=None, help="Parser processes for directories")
+    imp.add_argument('--external-id', default="UNSET")
+    imp.add_argument('--bulk', action='store_true', help="Use bulk inserts for single files")
+    imp.set_defaults(func=cmd_import)
+
+    rematch = commands.add_parser('rematch', help="Match unmatched rows against the matcher rules")
+    rematch.add_argument('--matchers', help="Load rules from this matcher file first")
+    rematch.set_defaults(func=cmd_rematch)
+
+    export = commands.add_parser('export', help="Write standardized CSV files")
+    export.add_argument('--output-dir', required=True)
+    export.add_argument('--file-id', type=int, action='append', help="Only this file, repeatable")
+    export.add_argument('--all', action='store_true', help="Include files already saved to GnuCash")
+    export.add_argument('--include-payments', action='store_true')
+    export.add_argument('--payments-account')
+    export.set_defaults(func=cmd_export)
+
+    post = commands.add_parser('post', help="Post every save ready file to the GnuCash book")
+    post.add_argument('--cc-account', required=True)
+    post.add_argument('--payments-account', required=True)
+    post.set_defaults(func=cmd_post)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as e:
+        print(f"ctrack {args.command}: {e}", file=sys.stderr)
+        return 1
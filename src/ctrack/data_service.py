@@ -6,28 +6,57 @@ import json
 import datetime 
 from decimal import Decimal
 from typing import Optional
+from dataclasses import dataclass, field
 from decimal import Decimal
 from datetime import datetime
 import warnings
-
-
-from piecash import open_book, create_book, Account as CASH_Account
-from piecash import Transaction, Split, Commodity
+import zlib
+import bisect
+import hashlib
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# piecash is imported where the GnuCash book is used, since importing it
+# costs more than everything else here and many callers never need it.
 from sqlalchemy.types import TypeDecorator
 from sqlalchemy import create_engine, Column, ForeignKey
-from sqlalchemy import Boolean, Integer, Date, String, Numeric
+from sqlalchemy import Boolean, Integer, Date, DateTime, String, Numeric, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.orm import object_session
 from sqlalchemy import exc as sa_exc
-from sqlalchemy import event
+from sqlalchemy import event, func, insert, select, or_, bindparam, type_coerce
+from sqlalchemy.pool import QueuePool, NullPool, SingletonThreadPool
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy_repr import RepresentableBase
 
+from ctrack.metrics import metrics, instrumented
+from ctrack.jobs import JobCancelled, current_job, report_progress, report_total
+
 # ----------------------------------------------------------------------
 # Custom Decimal handling for SQLite
 # ----------------------------------------------------------------------
 class SqliteDecimal(TypeDecorator):
+    """
+    Decimal values stored as integers in units of 10**-scale. Column
+    expressions of this type also have a .cents attribute that selects the
+    stored integer as is, for sums and bulk reads that do not need a
+    Decimal per row; cents_to_decimal converts such a value when one is
+    needed.
+    """
     impl = Integer
+    cache_ok = True
+
+    class comparator_factory(TypeDecorator.Comparator):
+
+        @property
+        def cents(self):
+            return type_coerce(self.expr, Integer)
 
     def __init__(self, scale):
         super().__init__()
@@ -54,6 +83,25 @@ class MetaData(Base):
     __tablename__ = 'meta_data'
     id = Column(Integer, primary_key=True, autoincrement=True)
     gnucash_file = Column(String)
+    # stat of the book when the accounts were last synced, see gnucash_file_stamp()
+    gnucash_mtime_ns = Column(Integer, nullable=True)
+    gnucash_size = Column(Integer, nullable=True)
+
+class JobRecord(Base):
+    """
+    History of the background jobs run by a ctrack.jobs.JobManager.
+    """
+    __tablename__ = 'jobs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String)
+    description = Column(String)
+    state = Column(String, index=True)
+    rows_done = Column(Integer, default=0)
+    rows_total = Column(Integer, nullable=True)
+    created = Column(DateTime)
+    started = Column(DateTime, nullable=True)
+    finished = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
 
 class ColumnMap(Base):
     __tablename__ = 'column_maps'
@@ -100,12 +148,141 @@ class MatcherRule(Base):
         return True, accnt.in_gnucash
 
 
+class MatcherEngine:
+    """
+    Finds the first rule, in id order, whose regexp matches a description.
+
+    Rules are folded into combined alternation patterns with one named group
+    per rule, so a single match call tests many rules at once. Python's
+    alternation tries branches left to right, so the winning group is the
+    same rule the one-at-a-time loop would have picked. Rules that can't be
+    embedded safely (their own capture groups might be referenced by number,
+    or global inline flags) are kept as standalone patterns and tried in
+    their place in the id order.
+    """
+
+    def __init__(self, rules):
+        self.steps = []
+        self.group_ids = {}
+        parts = []
+        for rule in sorted(rules, key=lambda r: r.id):
+            part = self.combinable_part(rule)
+            if part is None:
+                self.flush_parts(parts)
+                parts = []
+                self.steps.append((rule.compiled, rule.id))
+            else:
+                parts.append(part)
+        self.flush_parts(parts)
+
+    def combinable_part(self, rule):
+        if rule.compiled.groups > 0:
+            return None
+        name = f"m{rule.id}"
+        flags = "?i:" if rule.no_case else "?:"
+        part = f"(?P<{name}>({flags}{rule.regexp}))"
+        try:
+            re.compile(part)
+        except re.error:
+            return None
+        self.group_ids[name] = rule.id
+        return part
+
+    def flush_parts(self, parts):
+        if parts:
+            self.steps.append((re.compile("|".join(parts)), None))
+
+    def match(self, desc):
+        for pattern, rule_id in self.steps:
+            m = pattern.match(desc)
+            if m:
+                if rule_id is not None:
+                    return rule_id
+                return self.group_ids[m.lastgroup]
+        return None
+
+
+class DescriptionMatch(Base):
+    """
+    A remembered MatcherMemo entry: the rule that wins for a description,
+    or no rule. last_used orders entries from least to most recently used.
+    """
+    __tablename__ = 'description_matches'
+    description = Column(String, primary_key=True)
+    matcher_id = Column(Integer, ForeignKey("matcher_rules.id", ondelete="CASCADE"), nullable=True)
+    last_used = Column(Integer, index=True)
+
+
+class MatcherMemo:
+    """
+    Bounded least recently used map from description to the MatcherEngine
+    result for it, so a description seen before costs a dict lookup rather
+    than a regexp search. It answers match() like the engine it wraps.
+    Descriptions looked up or added since the last save are kept in
+    touched for DataService.save_matcher_memo.
+
+    Entries stay correct while rules are only added: a new rule has a
+    higher id than every existing one, so it can only win for descriptions
+    that no rule matched, and apply_new_rules updates exactly those.
+    signature is the (rule count, highest rule id) the entries are
+    current for, as kept by DataService.get_matcher.
+    """
+
+    def __init__(self, engine, capacity=None, entries=(), signature=None):
+        self.engine = engine
+        self.capacity = capacity if capacity is not None else MATCHER_MEMO_SIZE
+        self.entries = OrderedDict(entries)
+        self.touched = set()
+        self.signature = signature
+
+    def match(self, desc):
+        entries = self.entries
+        if desc in entries:
+            entries.move_to_end(desc)
+            matcher_id = entries[desc]
+        else:
+            matcher_id = entries[desc] = self.engine.match(desc)
+            if len(entries) > self.capacity:
+                oldest, _ = entries.popitem(last=False)
+                self.touched.discard(oldest)
+        self.touched.add(desc)
+        return matcher_id
+
+    def remember(self, desc, matcher_id):
+        """
+        Record a result found elsewhere, such as in an import worker.
+        """
+        self.entries[desc] = matcher_id
+        self.entries.move_to_end(desc)
+        if len(self.entries) > self.capacity:
+            oldest, _ = self.entries.popitem(last=False)
+            self.touched.discard(oldest)
+        self.touched.add(desc)
+
+    def apply_new_rules(self, new_engine):
+        """
+        Update the entries with no match that a MatcherEngine of newly
+        added rules matches, and return {description: new matcher id}.
+        """
+        changed = {}
+        for desc, matcher_id in self.entries.items():
+            if matcher_id is None:
+                new_id = new_engine.match(desc)
+                if new_id is not None:
+                    changed[desc] = new_id
+        self.entries.update(changed)
+        self.touched.update(changed)
+        return changed
+
+
 class CCTransactionFile(Base):
     __tablename__ = 'cc_transaction_files'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     external_id = Column(String)               # typically cc name string
     import_source_file = Column(String)
+    content_hash = Column(String, index=True)  # sha256 of the file bytes
+    header_signature = Column(String, index=True)  # see header_signature()
     column_map_id = Column(Integer, ForeignKey("column_maps.id", ondelete="SET NULL"), nullable=True)
     saved_to_gnucash = Column(Boolean, default=False)
     transactions = relationship("CCTransaction", backref="transaction_file")
@@ -124,23 +301,10 @@ class CCTransactionFile(Base):
         return f"ID-{self.id}:{Path(self.import_source_file).parts[-1]}"
 
     def rows_matched(self):
-        matched = unmatched = 0
-        for xact in self._dataservice.get_transactions(self):
-            if xact.matcher_id is not None:
-                matched += 1
-            else:
-                unmatched += 1
-        return matched, unmatched
+        return self._dataservice.get_row_counts([self.id]).get(self.id, (0, 0))
 
     def is_save_ready(self):
-        for xact in self._dataservice.get_transactions(self):
-            if xact.matcher_id is None:
-                return False
-            matcher = self._dataservice.get_matcher_by_id(xact.matcher_id)
-            account = self._dataservice.get_account(matcher.account_name)
-            if account is None or not account.in_gnucash:
-                return False
-        return True
+        return not self._dataservice.get_save_readiness([self.id])[self.id]
 
     def save_to_gnucash(self, cc_account_name, payments_account_name):
         if not self.is_save_ready():
@@ -187,38 +351,239 @@ def _inject_dataservice_on_load(target, context):
         target._dataservice = dataservice
 
 
+class HeaderSignature(Base):
+    """
+    A CSV header seen on import, by header_signature(), with the column
+    map chosen for it, or no map if none fitted when it was last checked.
+    """
+    __tablename__ = 'header_signatures'
+    signature = Column(String, primary_key=True)
+    col_names_json = Column(String)
+    column_map_id = Column(Integer, ForeignKey("column_maps.id", ondelete="SET NULL"), nullable=True)
+
+    def get_col_names(self):
+        return json.loads(self.col_names_json)
+
+
 class CCTransactionsRaw(Base):
     __tablename__ = 'cc_raw_transactions'
     id = Column(Integer, primary_key=True, autoincrement=True)
     col_names_json = Column(String)
-    rows_json = Column(String)
     file_id = Column(Integer, ForeignKey("cc_transaction_files.id", ondelete="CASCADE"))
 
     col_names = None
-    rows = None
 
     def get_col_names(self):
         if self.col_names is None:
             self.col_names = json.loads(self.col_names_json)
         return self.col_names
 
+
+class CCRawRowsPage(Base):
+    """
+    A run of consecutive raw CSV rows from one file, stored as they are
+    read so a file never has to be held in memory whole. Rows are kept as
+    zlib compressed JSON and addressed by (file_id, row number) through
+    first_row and row_count, so a reader only decodes the pages holding
+    the rows it asks for.
+    """
+    __tablename__ = 'cc_raw_row_pages'
+    __table_args__ = (Index('ix_cc_raw_row_pages_file_row', 'file_id', 'first_row', unique=True),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(Integer, ForeignKey("cc_transaction_files.id", ondelete="CASCADE"))
+    first_row = Column(Integer)
+    row_count = Column(Integer)
+    rows_data = Column(LargeBinary)
+
+    @staticmethod
+    def pack_rows(rows):
+        return zlib.compress(json.dumps(rows).encode())
+
     def get_rows(self):
-        if self.rows is None:
-            self.rows = json.loads(self.rows_json)
-        return self.rows
+        return json.loads(zlib.decompress(self.rows_data))
 
 
 class CCTransaction(Base):
     __tablename__ = 'cc_transactions'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    date = Column(Date)
+    date = Column(Date, index=True)
     description = Column(String)
     amount = Column(SqliteDecimal(2))
     is_payment = Column(Boolean, default=False)
-    file_id = Column(Integer, ForeignKey("cc_transaction_files.id", ondelete="CASCADE"))
-    matcher_id = Column(Integer, ForeignKey("matcher_rules.id", ondelete="SET NULL"), nullable=True)
+    file_id = Column(Integer, ForeignKey("cc_transaction_files.id", ondelete="CASCADE"), index=True)
+    matcher_id = Column(Integer, ForeignKey("matcher_rules.id", ondelete="SET NULL"), nullable=True,
+                        index=True)
     raw_row_number = Column(Integer)
 
+@dataclass
+class DataStatus:
+    """
+    Summary of the unsaved transaction files and of the accounts the
+    matcher rules refer to, as computed by DataService.get_status.
+    """
+    pending_files: int = 0
+    mapped_files: int = 0
+    unmapped_files: int = 0
+    files_with_unmatched: int = 0
+    matched_rows: int = 0
+    unmatched_rows: int = 0
+    # file id -> (matched, unmatched) for each pending file
+    file_rows: dict = field(default_factory=dict)
+    # sorted names of matcher accounts not defined locally / not in the book
+    missing_accounts: list = field(default_factory=list)
+    unsynced_accounts: list = field(default_factory=list)
+
+@dataclass
+class ReportTotal:
+    """
+    One group of a DataService.report_totals result. key is the group
+    value, or a tuple of them when grouping by more than one thing.
+    """
+    key: object
+    count: int
+    cents: int
+
+    @property
+    def total(self):
+        return cents_to_decimal(self.cents)
+
+
+def cents_to_decimal(cents, scale=2):
+    """
+    The Decimal SqliteDecimal reads back for a stored integer value.
+    """
+    return Decimal(cents) / 10 ** scale
+
+
+class RowParser:
+    """
+    Date and amount parsing for one ColumnMap, set up once and reused for
+    every row. Date formats made of %d, %m and %Y or %y fields between one
+    repeated separator, such as %m/%d/%Y, are split and converted directly
+    rather than going through strptime, and each distinct date string is
+    only converted once. Amounts with exactly two decimal places are turned
+    straight into integer cents. Anything else falls back to strptime and
+    Decimal, so results and errors are the same as theirs.
+    """
+
+    date_memo_size = 10000
+
+    def __init__(self, cmap):
+        self.cmap = cmap
+        self.date_column = cmap.date_column
+        self.description_column = cmap.description_column
+        self.amount_column = cmap.amount_column
+        self.date_format = cmap.date_format
+        self.dates = {}
+        self.split_date = None
+        m = re.fullmatch(r'(%[dmYy])([^%\w])(%[dmYy])\2(%[dmYy])', cmap.date_format)
+        if m:
+            fields = [m.group(1), m.group(3), m.group(4)]
+            if sorted(f.lower() for f in fields) == ['%d', '%m', '%y']:
+                self.date_sep = m.group(2)
+                self.date_fields = fields
+                self.split_date = True
+
+    def parse_date(self, text):
+        date = self.dates.get(text)
+        if date is None:
+            date = None
+            if self.split_date:
+                date = self.fast_date(text)
+            if date is None:
+                date = datetime.strptime(text, self.date_format)
+            if len(self.dates) >= self.date_memo_size:
+                self.dates.clear()
+            self.dates[text] = date
+        return date
+
+    def fast_date(self, text):
+        parts = text.split(self.date_sep)
+        if len(parts) != 3:
+            return None
+        values = {}
+        for field, part in zip(self.date_fields, parts):
+            if not (part.isascii() and part.isdigit()):
+                return None
+            if field == '%Y':
+                if len(part) != 4:
+                    return None
+                values['year'] = int(part)
+            elif field == '%y':
+                if len(part) != 2:
+                    return None
+                year = int(part)
+                values['year'] = year + (2000 if year < 69 else 1900)
+            else:
+                if not 0 < len(part) <= 2:
+                    return None
+                values['month' if field == '%m' else 'day'] = int(part)
+        return datetime(values['year'], values['month'], values['day'])
+
+    def parse_amount(self, text):
+        """
+        Return (integer cents, amount > 0) for an amount string.
+        """
+        whole, dot, frac = text.partition('.')
+        digits = whole[1:] if whole[:1] in ('-', '+') else whole
+        if (len(frac) == 2 and frac.isascii() and frac.isdigit() and
+                (digits == '' or (digits.isascii() and digits.isdigit()))):
+            cents = int(whole + frac)
+            return cents, cents > 0
+        amount = Decimal(text)
+        return int(amount * 100), amount > 0
+
+
+def parse_transaction_rows(rows, first_row, parser, engine):
+    """
+    Turn raw CSV rows, numbered from first_row, into CCTransaction column
+    values using a RowParser and a MatcherEngine. The amount is given as
+    integer cents under amount_cents, and file_id is left for the caller
+    to fill in.
+    """
+    res = []
+    for index, row in enumerate(rows, first_row):
+        desc = row[parser.description_column]
+        cents, is_payment = parser.parse_amount(row[parser.amount_column])
+        res.append(dict(date=parser.parse_date(row[parser.date_column]),
+                        description=desc,
+                        amount_cents=cents,
+                        is_payment=is_payment,
+                        matcher_id=engine.match(desc),
+                        raw_row_number=index))
+    return res
+
+
+def bulk_insert_transactions():
+    """
+    Core INSERT for parse_transaction_rows values, binding amount_cents
+    to the amount column as the stored integer.
+    """
+    return insert(CCTransaction.__table__).values(
+        amount=bindparam('amount_cents', type_=Integer))
+
+
+def file_content_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def read_row_chunks(reader, size):
+    """
+    Yield (first row number, rows) for consecutive chunks of at most size
+    rows from a csv.DictReader.
+    """
+    chunk = []
+    first_row = 0
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield first_row, chunk
+            first_row += len(chunk)
+            chunk = []
+    if chunk:
+        yield first_row, chunk
+
 # ----------------------------------------------------------------------
 # Hard-coded column maps (e.g. for Bank of America)
 # ----------------------------------------------------------------------
@@ -232,6 +597,195 @@ card_file_col_maps = {
 }
 
 
+# Most ids bound into a single IN (...) clause, kept under the 999 host
+# parameter limit of older SQLite builds.
+MAX_IN_PARAMS = 900
+
+# Rows per executemany call when loading transactions in bulk mode.
+BULK_BATCH_SIZE = 5000
+
+# Raw CSV rows read, stored and parsed together during an import.
+RAW_PAGE_SIZE = 1000
+
+# Most descriptions a MatcherMemo holds, in memory and in ctrack.db.
+MATCHER_MEMO_SIZE = 50000
+
+# (table, column) for columns added to tables that a ctrack.db made by an
+# earlier version already has. create_all never alters an existing table,
+# so DataService.upgrade_schema adds whichever of these are missing.
+ADDED_COLUMNS = [
+    ('cc_transaction_files', 'content_hash'),
+    ('cc_transaction_files', 'header_signature'),
+    ('meta_data', 'gnucash_mtime_ns'),
+    ('meta_data', 'gnucash_size'),
+]
+
+# Sort keys accepted by DataService.get_transaction_page and the
+# CCTransaction attribute each one orders by.
+TRANSACTION_SORT_KEYS = {
+    "row": "raw_row_number",
+    "date": "date",
+    "description": "description",
+    "amount": "amount",
+}
+
+
+def choose_column_map(cmaps, columns):
+    for cmap in cmaps:
+        if (cmap.date_column in columns and
+            cmap.description_column in columns and
+            cmap.amount_column in columns):
+            return cmap
+    return None
+
+
+def header_signature(columns):
+    """
+    Hash of a CSV header's column names, ignoring their order and any
+    repeats. Whether a column map fits a header depends only on this set,
+    so every file with the same signature gets the same map.
+    """
+    names = sorted(set(columns or []))
+    return hashlib.sha1("\x1f".join(names).encode()).hexdigest()
+
+
+class ColumnMapIndex:
+    """
+    Column maps indexed for choosing one by CSV header. The maps are
+    grouped by date column, so only those whose date column is in the
+    header are checked, and the chosen map id (or None) is kept per header
+    signature, so each distinct header is only checked once. The first
+    fitting map in id order is chosen, as choose_column_map would over all
+    maps in id order.
+    """
+
+    def __init__(self, cmaps, signatures=None):
+        self.maps = {}
+        self.by_date_column = {}
+        # header signature -> column map id or None
+        self.signatures = dict(signatures or {})
+        for cmap in sorted(cmaps, key=lambda c: c.id):
+            self.add(cmap)
+
+    def add(self, cmap):
+        self.maps[cmap.id] = cmap
+        self.by_date_column.setdefault(cmap.date_column, []).append(cmap)
+
+    def candidates(self, columns):
+        res = []
+        for name in set(columns or []):
+            res.extend(self.by_date_column.get(name, ()))
+        return sorted(res, key=lambda c: c.id)
+
+    def choose(self, columns, signature=None):
+        if signature is None:
+            signature = header_signature(columns)
+        if signature in self.signatures:
+            map_id = self.signatures[signature]
+            if map_id is None:
+                return None
+            if map_id in self.maps:
+                return self.maps[map_id]
+        cmap = choose_column_map(self.candidates(columns), columns or [])
+        self.signatures[signature] = cmap.id if cmap is not None else None
+        return cmap
+
+
+@dataclass
+class ImportResult:
+    """
+    Outcome of importing one file of a directory: the file record, or
+    the error that stopped it.
+    """
+    path: Path
+    file_rec: Optional[CCTransactionFile] = None
+    error: Optional[BaseException] = None
+
+
+# Column maps, matcher engine and known content hashes for the worker
+# processes of DataService.import_directory, set once per process by
+# init_import_worker.
+worker_state = {}
+
+
+def init_import_worker(column_maps, signatures, rules, memo_entries, known_hashes, spool_dir):
+    worker_state['column_maps'] = ColumnMapIndex([ColumnMap(**values) for values in column_maps],
+                                                 signatures)
+    worker_state['parsers'] = {}
+    worker_state['engine'] = MatcherMemo(MatcherEngine([MatcherRule(**values) for values in rules]),
+                                         entries=memo_entries)
+    worker_state['known_hashes'] = known_hashes
+    worker_state['spool_dir'] = spool_dir
+
+
+def parse_transaction_file(path):
+    """
+    Worker side of DataService.import_directory. Hash, read, column map,
+    parse and match one CSV file. Each page is written as it is parsed to
+    a spool file, as (first row number, row count, compressed raw rows,
+    transaction column values), so neither this process nor the writer
+    holds the whole file. Returns the header details, the row count and
+    the spool file's path as plain data. Files whose contents are already
+    in the database are only hashed.
+    """
+    content_hash = file_content_hash(path)
+    res = dict(path=path, content_hash=content_hash, duplicate=False)
+    if content_hash in worker_state['known_hashes']:
+        res['duplicate'] = True
+        return res
+    spool = tempfile.NamedTemporaryFile(dir=worker_state['spool_dir'], prefix="import-",
+                                        suffix=".spool", delete=False)
+    res['spool_path'] = spool.name
+    try:
+        with spool, open(path) as f:
+            reader = csv.DictReader(f)
+            res['field_names'] = reader.fieldnames
+            res['header_signature'] = header_signature(reader.fieldnames)
+            cmap = worker_state['column_maps'].choose(reader.fieldnames, res['header_signature'])
+            res['column_map_id'] = cmap.id if cmap is not None else None
+            res['rows'] = 0
+            for first_row, rows in read_row_chunks(reader, RAW_PAGE_SIZE):
+                xactions = []
+                if cmap is not None:
+                    parser = worker_state['parsers'].get(cmap.id)
+                    if parser is None:
+                        parser = worker_state['parsers'][cmap.id] = RowParser(cmap)
+                    xactions = list(parse_transaction_rows(rows, first_row, parser,
+                                                           worker_state['engine']))
+                pickle.dump((first_row, len(rows), CCRawRowsPage.pack_rows(rows), xactions), spool)
+                res['rows'] += len(rows)
+    except BaseException:
+        Path(spool.name).unlink(missing_ok=True)
+        raise
+    return res
+
+
+def discard_parsed_file(future):
+    """
+    Wait for a parse_transaction_file future that will not be stored and
+    remove its spool file.
+    """
+    try:
+        parsed = future.result()
+    except Exception:
+        return
+    if parsed.get('spool_path'):
+        Path(parsed['spool_path']).unlink(missing_ok=True)
+
+
+def read_spooled_pages(spool_path):
+    """
+    Yield the pages parse_transaction_file wrote to a spool file, one at
+    a time.
+    """
+    with open(spool_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
 def get_account_defs(parent, acc_type, parent_string=None, leaf_only=True):
     recs = []
     for acc in parent.children:
@@ -244,17 +798,250 @@ def get_account_defs(parent, acc_type, parent_string=None, leaf_only=True):
     return recs
 
 
+def gnucash_file_stamp(gnucash_path):
+    """
+    The book file's (mtime_ns, size), which changes whenever GnuCash or
+    piecash writes to it.
+    """
+    stat = Path(gnucash_path).stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
 def extract_gnucash_accounts(gnucash_path, account_type="EXPENSE"):
+    from piecash import open_book
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=sa_exc.SAWarning)
         with open_book(str(gnucash_path)) as book:
             return get_account_defs(book.root_account, account_type)
 
+def find_child_account(parent, name):
+    for acc in parent.children:
+        if acc.name == name:
+            return acc
+    return None
+
+
+def add_book_account(book, path, description, commodity):
+    """
+    Make sure the expense account with the given colon separated path
+    exists in the book, creating any missing levels, and return it.
+    """
+    from piecash import Account as CASH_Account
+    parent = book.root_account
+    parts = path.split(':')
+    for idx, part in enumerate(parts):
+        account = find_child_account(parent, part)
+        if not account:
+            desc = description if idx == len(parts) - 1 else ""
+            account = CASH_Account(name=part,
+                                   type="EXPENSE",
+                                   parent=parent,
+                                   commodity=commodity,
+                                   description=desc)
+        parent = account
+    return parent
+
+
+class BookPoster:
+    """
+    Adds CCTransaction rows to a GnuCash book as transactions, keeping the
+    piecash accounts it has looked up so each is resolved once however
+    many files or rows are posted.
+    """
+
+    def __init__(self, book):
+        self.book = book
+        self.usd = book.commodities(mnemonic="USD")
+        self.accounts = {}
+
+    def get_account(self, fullname):
+        account = self.accounts.get(fullname)
+        if account is None:
+            account = self.accounts[fullname] = self.book.accounts(fullname=fullname)
+        return account
+
+    def post_file(self, rows, cc_name, include_payments=False, payments_name=None):
+        """
+        Post rows from DataService.get_transactions_with_accounts and
+        return the change in balance, in the account's natural sign, of
+        every account touched. Amounts are added up in integer cents and
+        only made into Decimals for the splits and the returned totals.
+        """
+        from piecash import Transaction, Split
+        deltas = {}
+
+        def add_split(name, cents):
+            account = self.get_account(name)
+            deltas[name] = deltas.get(name, 0) + cents * account.sign
+            return Split(account=account, value=cents_to_decimal(cents))
+
+        for index, row in enumerate(rows, 1):
+            if index % RAW_PAGE_SIZE == 0:
+                report_progress(RAW_PAGE_SIZE)
+            if row.is_payment:
+                if include_payments:
+                    Transaction(
+                        currency=self.usd,
+                        post_date=row.date,
+                        description="Payment",
+                        splits=[
+                            add_split(payments_name, -row.amount_cents),
+                            add_split(cc_name, row.amount_cents)
+                        ]
+                    )
+                continue
+
+            Transaction(
+                currency=self.usd,
+                post_date=row.date,
+                description=row.description,
+                splits=[
+                    add_split(cc_name, row.amount_cents),
+                    add_split(row.account_name, -row.amount_cents)
+                ]
+            )
+        report_progress(len(rows) % RAW_PAGE_SIZE)
+        metrics.add_rows(len(rows))
+        return {name: cents_to_decimal(cents) for name, cents in deltas.items()}
+
+
+class GnuCashSession:
+    """
+    The GnuCash book held open for writing across a batch of DataService
+    operations, so the batch pays the open_book cost once. Changes reach
+    the file on commit() and are dropped by rollback(). Local database
+    updates that record the book changes are queued with after_commit and
+    only applied once the book has been saved. As a context manager it
+    commits on a clean exit, rolls back on an exception and closes the book
+    either way.
+
+    Only one session per DataService can be open. Another thread that
+    needs the book waits for it to close, and opening a second one from
+    the owning thread is an error.
+    """
+
+    def __init__(self, dataservice):
+        self.dataservice = dataservice
+        self.book = None
+        self.owner = None
+        self.commit_callbacks = []
+
+    def open(self):
+        from piecash import open_book
+        current = self.dataservice.gnucash_session
+        if current is not None and current.owner == threading.get_ident():
+            raise Exception('gnucash session already open in this thread')
+        self.dataservice.gnucash_lock.acquire()
+        opened = False
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=sa_exc.SAWarning)
+                self.book = open_book(str(self.dataservice.gnucash_path), readonly=False)
+            opened = True
+        finally:
+            if not opened:
+                self.dataservice.gnucash_lock.release()
+        self.owner = threading.get_ident()
+        self.dataservice.gnucash_session = self
+        return self
+
+    def after_commit(self, callback):
+        self.commit_callbacks.append(callback)
+
+    def commit(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=sa_exc.SAWarning)
+            self.book.save()
+        callbacks = self.commit_callbacks
+        self.commit_callbacks = []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self.book.cancel()
+        self.commit_callbacks = []
+
+    def close(self):
+        try:
+            self.book.close()
+        finally:
+            self.book = None
+            self.owner = None
+            self.dataservice.gnucash_session = None
+            self.dataservice.gnucash_lock.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+        return False
+
+
+@dataclass
+class EngineProfile:
+    """
+    SQLite settings for the ctrack.db engine. The defaults suit the long
+    running NiceGUI server, where UI reads run while imports write: WAL
+    journaling so readers don't block on the writer, NORMAL sync (safe
+    with WAL), a 64MB page cache, 256MB of memory mapped I/O and in memory
+    temp tables. Connections are pooled and may be used from any thread.
+    pool is one of "queue", "null" or "singleton".
+    """
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cache_size: int = -64000          # negative means KiB rather than pages
+    mmap_size: int = 256 * 1024 * 1024
+    temp_store: str = "MEMORY"
+    busy_timeout: float = 30.0        # seconds to wait on a locked database
+    pool: str = "queue"
+    pool_size: int = 5
+    max_overflow: int = 10
+
+    pool_classes = {
+        "queue": QueuePool,
+        "null": NullPool,
+        "singleton": SingletonThreadPool,
+    }
+
+    def create_engine(self, db_file):
+        kwargs = dict(poolclass=self.pool_classes[self.pool],
+                      connect_args={'check_same_thread': False,
+                                    'timeout': self.busy_timeout})
+        if self.pool == "queue":
+            kwargs.update(pool_size=self.pool_size, max_overflow=self.max_overflow)
+        engine = create_engine(f'sqlite:///{db_file}', **kwargs)
+        event.listen(engine, "connect", self.apply_pragmas)
+        return engine
+
+    def apply_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            cursor.execute(f"PRAGMA synchronous={self.synchronous}")
+            cursor.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+            cursor.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            cursor.execute(f"PRAGMA temp_store={self.temp_store}")
+        finally:
+            cursor.close()
+
+
+@instrumented
 class DataService:
-    def __init__(self, ops_dir):
+    def __init__(self, ops_dir, engine_profile=None):
         self.ops_dir = Path(ops_dir)
         self.db_file = self.ops_dir / "ctrack.db"
-        self.engine = create_engine(f'sqlite:///{self.db_file}')
+        if engine_profile is None:
+            engine_profile = EngineProfile()
+        self.engine_profile = engine_profile
+        self.engine = engine_profile.create_engine(self.db_file)
+        metrics.watch_engine(self.engine)
         # ---- NEW: register this DataService as the owner of the engine ----
         import weakref
         self.engine._dataservice_owner = weakref.ref(self)
@@ -264,12 +1051,22 @@ class DataService:
         self.transaction_sets = {}
         self.gnucash_path = None
         self.matcher_file_path = None
+        self.matcher_engine = None
+        self.matcher_engine_signature = None
+        self.matcher_memo = None
+        self.matcher_memo_clock = 0
+        self.gnucash_session = None
+        self.gnucash_lock = threading.Lock()
+        self.row_parsers = {}
+        self.column_map_index = None
+        self.column_map_index_signature = None
         self.ensure_tables()
 
     # ------------------------------------------------------------------
     # Table initialisation / meta handling
     # ------------------------------------------------------------------
     def ensure_tables(self):
+        self.upgrade_schema()
         session = self.Session()
         try:
             for name, mapping in card_file_col_maps.items():
@@ -286,10 +1083,69 @@ class DataService:
             meta = session.query(MetaData).first()
             if meta:
                 self.gnucash_path = meta.gnucash_file
-                print('found file')
         finally:
             session.close()
 
+    def upgrade_schema(self):
+        """
+        Bring a ctrack.db made by an earlier version up to the models: add
+        the ADDED_COLUMNS its tables lack and create any missing indexes.
+        """
+        with self.engine.begin() as conn:
+            table_columns = {}
+            for table_name, column_name in ADDED_COLUMNS:
+                if table_name not in table_columns:
+                    table_columns[table_name] = {
+                        row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table_name})")}
+                if column_name not in table_columns[table_name]:
+                    column = Base.metadata.tables[table_name].c[column_name]
+                    conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} "
+                                         f"{column.type.compile(dialect=conn.dialect)}")
+                    table_columns[table_name].add(column_name)
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+            self.backfill_header_signatures(conn)
+            self.convert_legacy_raw_rows(conn)
+
+    def backfill_header_signatures(self, conn):
+        """
+        Fill in the header signature of files imported before signatures
+        were kept, from their stored column names.
+        """
+        files = CCTransactionFile.__table__
+        q = (select(files.c.id, CCTransactionsRaw.__table__.c.col_names_json)
+             .join(CCTransactionsRaw.__table__, CCTransactionsRaw.__table__.c.file_id == files.c.id)
+             .where(files.c.header_signature.is_(None)))
+        values = [dict(b_id=file_id, b_signature=header_signature(json.loads(col_names_json)))
+                  for file_id, col_names_json in conn.execute(q)]
+        if values:
+            conn.execute(files.update().where(files.c.id == bindparam('b_id'))
+                         .values(header_signature=bindparam('b_signature')), values)
+
+    def convert_legacy_raw_rows(self, conn):
+        """
+        Move the raw rows that earlier versions kept as one JSON list per
+        file, in cc_raw_transactions.rows_json, into raw pages, one file
+        at a time, and clear the JSON.
+        """
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(cc_raw_transactions)")}
+        if 'rows_json' not in columns:
+            return
+        raw_ids = [raw_id for raw_id, in conn.exec_driver_sql(
+            "SELECT id FROM cc_raw_transactions WHERE rows_json IS NOT NULL")]
+        pages = CCRawRowsPage.__table__
+        for raw_id in raw_ids:
+            file_id, rows_json = conn.exec_driver_sql(
+                "SELECT file_id, rows_json FROM cc_raw_transactions WHERE id = ?", (raw_id,)).one()
+            values = [dict(file_id=file_id, first_row=first_row, row_count=len(rows),
+                           rows_data=CCRawRowsPage.pack_rows(rows))
+                      for first_row, rows in read_row_chunks(json.loads(rows_json), RAW_PAGE_SIZE)]
+            if values:
+                conn.execute(insert(pages), values)
+            conn.exec_driver_sql("UPDATE cc_raw_transactions SET rows_json = NULL WHERE id = ?",
+                                 (raw_id,))
+
     # ------------------------------------------------------------------
     # ColumnMap helpers
     # ------------------------------------------------------------------
@@ -317,11 +1173,73 @@ class DataService:
                             amount_column=amount_column,
                             date_format=date_format)
             session.add(rec)
+            session.flush()
+            # headers that no earlier map fitted are the only ones this one
+            # can be chosen for
+            for known in session.query(HeaderSignature).filter(HeaderSignature.column_map_id.is_(None)):
+                if choose_column_map([rec], known.get_col_names()) is not None:
+                    known.column_map_id = rec.id
             session.commit()
+            self.column_map_index = None
             return rec
         finally:
             session.close()
 
+    def get_column_map_index(self, session):
+        """
+        Return the ColumnMapIndex of all column maps and known header
+        signatures, rebuilding it when the map count or highest map id has
+        changed since the last build.
+        """
+        signature = tuple(session.query(func.count(ColumnMap.id), func.max(ColumnMap.id)).one())
+        if self.column_map_index is None or signature != self.column_map_index_signature:
+            cmaps = list(session.query(ColumnMap))
+            for cmap in cmaps:
+                session.expunge(cmap)
+            known = dict(session.query(HeaderSignature.signature, HeaderSignature.column_map_id))
+            self.column_map_index = ColumnMapIndex(cmaps, known)
+            self.column_map_index_signature = signature
+        return self.column_map_index
+
+    def find_column_map(self, session, columns, signature=None):
+        """
+        Return the column map that fits the CSV header, or None, and record
+        the header signature and result the first time a header is seen.
+        """
+        if signature is None:
+            signature = header_signature(columns)
+        index = self.get_column_map_index(session)
+        known = signature in index.signatures
+        cmap = index.choose(columns, signature)
+        if not known:
+            self.record_header_signature(session, signature, columns,
+                                         cmap.id if cmap is not None else None)
+        return cmap
+
+    def record_header_signature(self, session, signature, columns, column_map_id):
+        session.merge(HeaderSignature(signature=signature,
+                                      col_names_json=json.dumps(sorted(set(columns or []))),
+                                      column_map_id=column_map_id))
+
+    def get_files_for_column_map(self, cmap):
+        """
+        Return the unsaved, unmapped files whose header the column map
+        was chosen for, plus any unmapped file whose header signature is
+        missing or not recorded, so they can be remapped.
+        """
+        session = self.Session(expire_on_commit=False)
+        try:
+            return list(session.query(CCTransactionFile)
+                        .outerjoin(HeaderSignature,
+                                   HeaderSignature.signature == CCTransactionFile.header_signature)
+                        .filter(CCTransactionFile.saved_to_gnucash == False)
+                        .filter(CCTransactionFile.column_map_id.is_(None))
+                        .filter(or_(HeaderSignature.column_map_id == cmap.id,
+                                    HeaderSignature.signature.is_(None)))
+                        .order_by(CCTransactionFile.id))
+        finally:
+            session.close()
+
     # ------------------------------------------------------------------
     # GnuCash file handling
     # ------------------------------------------------------------------
@@ -339,21 +1257,97 @@ class DataService:
             session.close()
 
         self.gnucash_path = gnucash_path
-        self.load_accounts(extract_gnucash_accounts(gnucash_path))
-
-    def load_gnucash_file(self):
-        self.load_accounts(extract_gnucash_accounts(self.gnucash_path))
-
-    def load_accounts(self, recs):
+        self.sync_gnucash_accounts()
+
+    def load_gnucash_file(self, force=False):
+        return self.sync_gnucash_accounts(force)
+
+    def sync_gnucash_accounts(self, force=False):
+        """
+        Bring the accounts table up to date with the book, unless the book
+        file's stamp is the one recorded at the last sync. Returns False
+        when skipped, else the (inserted, updated, deleted) counts.
+        """
+        stamp = gnucash_file_stamp(self.gnucash_path)
         session = self.Session()
         try:
-            session.query(Account).delete()
+            meta = session.query(MetaData).first()
+            if not force and (meta.gnucash_mtime_ns, meta.gnucash_size) == stamp:
+                return False
+        finally:
+            session.close()
+        return self.load_accounts(extract_gnucash_accounts(self.gnucash_path), stamp)
+
+    def open_gnucash_session(self):
+        """
+        Open the GnuCash book for a batch of writes, see GnuCashSession.
+        Book writing DataService methods called from the same thread
+        while it is open use it rather than opening the book themselves.
+        """
+        return GnuCashSession(self).open()
+
+    @contextmanager
+    def use_gnucash_session(self):
+        """
+        Yield the GnuCashSession this thread has open, leaving commit to its
+        owner, or a one-shot session that is committed when the block
+        exits cleanly.
+        """
+        current = self.gnucash_session
+        if current is not None and current.owner == threading.get_ident():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=sa_exc.SAWarning)
+                yield current
+            return
+        with self.open_gnucash_session() as gc_session:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=sa_exc.SAWarning)
+                yield gc_session
+
+    def load_accounts(self, recs, stamp=None):
+        """
+        Make the in_gnucash accounts match recs, the book's account defs,
+        with bulk inserts, updates and deletes of just the differences.
+        Local accounts not yet saved to the book are kept, and marked
+        in_gnucash if the book has them now. A stamp from
+        gnucash_file_stamp() is recorded in the same transaction; without
+        one the recorded stamp is cleared, so the next sync reads the book.
+        """
+        table = Account.__table__
+        session = self.Session()
+        try:
+            local = {name: (acct_id, description, in_gnucash) for acct_id, name, description, in_gnucash
+                     in session.query(Account.id, Account.name, Account.description, Account.in_gnucash)}
+            book = {}
             for item in recs:
-                if not session.query(Account).filter_by(name=item['name']).first():
-                    session.add(Account(name=item['name'],
-                                        description=item['description'],
-                                        in_gnucash=True))
+                book.setdefault(item['name'], item['description'])
+            inserts = []
+            updates = []
+            for name, description in book.items():
+                if name not in local:
+                    inserts.append(dict(name=name, description=description, in_gnucash=True))
+                    continue
+                acct_id, old_description, in_gnucash = local[name]
+                if old_description != description or not in_gnucash:
+                    updates.append(dict(b_id=acct_id, b_description=description))
+            deletes = [dict(b_id=acct_id) for name, (acct_id, _, in_gnucash) in local.items()
+                       if in_gnucash and name not in book]
+            if inserts:
+                session.execute(insert(table), inserts)
+            if updates:
+                session.execute(table.update().where(table.c.id == bindparam('b_id'))
+                                .values(description=bindparam('b_description'), in_gnucash=True),
+                                updates)
+            if deletes:
+                session.execute(table.delete().where(table.c.id == bindparam('b_id')), deletes)
+            if stamp is None:
+                stamp = (None, None)
+            session.query(MetaData).update(
+                {MetaData.gnucash_mtime_ns: stamp[0], MetaData.gnucash_size: stamp[1]},
+                synchronize_session=False)
             session.commit()
+            metrics.add_rows(len(inserts) + len(updates) + len(deletes))
+            return len(inserts), len(updates), len(deletes)
         finally:
             session.close()
 
@@ -392,74 +1386,40 @@ class DataService:
             session.close()
 
     def save_account(self, name):
-        def find_account(parent, name):
-            for acc in parent.children:
-                if acc.name == name:
-                    return acc
-            return None
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", category=sa_exc.SAWarning)
-            with open_book(str(self.gnucash_path), readonly=False) as book:
-                USD = book.commodities.get(mnemonic="USD")
-                session = self.Session()
-                try:
-                    l_accnt = session.query(Account).filter_by(name=name).first()
-                    parent = book.root_account
-                    parts = l_accnt.name.split(':')
-                    for idx, part in enumerate(parts):
-                        account = find_account(parent, part)
-                        if not account:
-                            desc = l_accnt.description if idx == len(parts) - 1 else ""
-                            account = CASH_Account(name=part,
-                                                   type="EXPENSE",
-                                                   parent=parent,
-                                                   commodity=USD,
-                                                   description=desc)
-                        parent = account
-                    book.save()
-                    l_accnt.in_gnucash = True
-                    session.commit()
-                finally:
-                    session.close()
+        with self.use_gnucash_session() as gc_session:
+            book = gc_session.book
+            USD = book.commodities.get(mnemonic="USD")
+            l_accnt = self.get_account(name)
+            add_book_account(book, l_accnt.name, l_accnt.description, USD)
+            gc_session.after_commit(lambda: self.mark_accounts_in_gnucash([name]))
 
     def update_gnucash_accounts(self):
-        def find_account(parent, name):
-            for acc in parent.children:
-                if acc.name == name:
-                    return acc
-            return None
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", category=sa_exc.SAWarning)
-            with open_book(str(self.gnucash_path), readonly=False) as book:
-                USD = book.commodities.get(mnemonic="USD")
-                session = self.Session()
-                try:
-                    for l_accnt in session.query(Account).filter_by(in_gnucash=False):
-                        parent = book.root_account
-                        parts = l_accnt.name.split(':')
-                        for idx, part in enumerate(parts):
-                            account = find_account(parent, part)
-                            if not account:
-                                desc = l_accnt.description if idx == len(parts) - 1 else ""
-                                account = CASH_Account(name=part,
-                                                       type="EXPENSE",
-                                                       parent=parent,
-                                                       commodity=USD,
-                                                       description=desc)
-                                print(f"Added account {account}")
-                            parent = account
-                    book.save()
-                finally:
-                    session.close()
+        with self.use_gnucash_session() as gc_session:
+            book = gc_session.book
+            USD = book.commodities.get(mnemonic="USD")
+            session = self.Session()
+            try:
+                for l_accnt in session.query(Account).filter_by(in_gnucash=False):
+                    add_book_account(book, l_accnt.name, l_accnt.description, USD)
+            finally:
+                session.close()
+
+    def mark_accounts_in_gnucash(self, names):
+        session = self.Session()
+        try:
+            session.query(Account).filter(Account.name.in_(names)).update(
+                {Account.in_gnucash: True}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
 
     # ------------------------------------------------------------------
     # Matcher helpers
     # ------------------------------------------------------------------
     def load_matcher_file(self, matcher_file_path):
         self.matcher_file_path = matcher_file_path
-        session = self.Session()
+        session = self.Session(expire_on_commit=False)
+        added = []
         try:
             with open(matcher_file_path) as f:
                 for row in csv.DictReader(f):
@@ -467,12 +1427,17 @@ class DataService:
                     no_case = row['re_no_case'].lower() == "true"
                     name = row['account_path']
                     if not session.query(MatcherRule).filter_by(regexp=re_str).first():
-                        session.add(MatcherRule(regexp=re_str,
-                                                no_case=no_case,
-                                                account_name=name))
+                        rec = MatcherRule(regexp=re_str,
+                                          no_case=no_case,
+                                          account_name=name)
+                        session.add(rec)
+                        added.append(rec)
+            session.flush()
+            self.apply_rules_to_memo(session, added)
             session.commit()
         finally:
             session.close()
+        return added
 
     def matchers_count(self):
         session = self.Session()
@@ -495,11 +1460,136 @@ class DataService:
         finally:
             session.close()
 
+    def get_matcher_engine(self):
+        """
+        Return a MatcherEngine for the current rule set, rebuilding it only
+        when the rule count or highest rule id has changed since the last build.
+        """
+        session = self.Session()
+        try:
+            signature = session.query(func.count(MatcherRule.id), func.max(MatcherRule.id)).one()
+            signature = tuple(signature)
+            if self.matcher_engine is None or signature != self.matcher_engine_signature:
+                rules = list(session.query(MatcherRule).order_by(MatcherRule.id))
+                self.matcher_engine = MatcherEngine(rules)
+                self.matcher_engine_signature = signature
+            return self.matcher_engine
+        finally:
+            session.close()
+
+    def get_matcher(self):
+        """
+        Return the MatcherMemo in front of the current MatcherEngine,
+        loading the remembered descriptions from the database on first use
+        and catching it up with rules added since, here or elsewhere.
+        """
+        engine = self.get_matcher_engine()
+        signature = self.matcher_engine_signature
+        if self.matcher_memo is not None and self.matcher_memo.signature != signature:
+            self.refresh_matcher_memo(signature)
+        if self.matcher_memo is None:
+            session = self.Session()
+            try:
+                q = (session.query(DescriptionMatch.description, DescriptionMatch.matcher_id,
+                                   DescriptionMatch.last_used)
+                     .order_by(DescriptionMatch.last_used.desc())
+                     .limit(MATCHER_MEMO_SIZE))
+                rows = list(q)
+            finally:
+                session.close()
+            self.matcher_memo = MatcherMemo(engine, MATCHER_MEMO_SIZE,
+                                            ((desc, mid) for desc, mid, used in reversed(rows)),
+                                            signature)
+            self.matcher_memo_clock = rows[0].last_used if rows else 0
+        self.matcher_memo.engine = engine
+        return self.matcher_memo
+
+    def refresh_matcher_memo(self, signature):
+        """
+        Bring the memo up to date for the rule set with this signature by
+        testing the descriptions no rule matched against just the rules
+        with ids above the highest one it has seen. If rules were removed
+        rather than added, the memo is dropped and reloaded instead.
+        """
+        memo = self.matcher_memo
+        old_count, old_max = memo.signature or (0, None)
+        session = self.Session()
+        try:
+            new_rules = list(session.query(MatcherRule)
+                             .filter(MatcherRule.id > (old_max or 0))
+                             .order_by(MatcherRule.id))
+        finally:
+            session.close()
+        if signature[0] - old_count != len(new_rules):
+            self.matcher_memo = None
+            return
+        if new_rules:
+            memo.apply_new_rules(MatcherEngine(new_rules))
+        memo.signature = signature
+
+    def save_matcher_memo(self, session):
+        """
+        Write the memo entries used since the last save to the session, in
+        use order, and drop the least recently used rows beyond the memo
+        size. If rules were added since the memo was last brought up to
+        date, its entries with no match may be out of date and are not
+        written.
+        """
+        memo = self.matcher_memo
+        if memo is None or not memo.touched:
+            return
+        current = tuple(session.query(func.count(MatcherRule.id), func.max(MatcherRule.id)).one())
+        stale = current != memo.signature
+        values = []
+        for desc, matcher_id in memo.entries.items():
+            if desc in memo.touched and not (stale and matcher_id is None):
+                self.matcher_memo_clock += 1
+                values.append(dict(description=desc, matcher_id=matcher_id,
+                                   last_used=self.matcher_memo_clock))
+        memo.touched = set()
+        stmt = sqlite_insert(DescriptionMatch.__table__)
+        stmt = stmt.on_conflict_do_update(index_elements=['description'],
+                                          set_=dict(matcher_id=stmt.excluded.matcher_id,
+                                                    last_used=stmt.excluded.last_used))
+        for start in range(0, len(values), BULK_BATCH_SIZE):
+            session.execute(stmt, values[start:start + BULK_BATCH_SIZE])
+        oldest_kept = (session.query(DescriptionMatch.last_used)
+                       .order_by(DescriptionMatch.last_used.desc())
+                       .offset(MATCHER_MEMO_SIZE - 1).limit(1).scalar())
+        if oldest_kept is not None:
+            session.query(DescriptionMatch).filter(DescriptionMatch.last_used < oldest_kept).delete(
+                synchronize_session=False)
+
+    def apply_rules_to_memo(self, session, rules):
+        """
+        Bring the remembered descriptions up to date for newly added rules,
+        in memory and in the session. Only descriptions no rule matched can
+        change, and they change to the first new rule that matches them.
+        """
+        if not rules:
+            return
+        engine = MatcherEngine(rules)
+        if self.matcher_memo is not None:
+            self.matcher_memo.apply_new_rules(engine)
+        by_rule = {}
+        for desc, in session.query(DescriptionMatch.description).filter(
+                DescriptionMatch.matcher_id.is_(None)):
+            matcher_id = engine.match(desc)
+            if matcher_id is not None:
+                by_rule.setdefault(matcher_id, []).append(desc)
+        for matcher_id, descs in by_rule.items():
+            for start in range(0, len(descs), MAX_IN_PARAMS):
+                chunk = descs[start:start + MAX_IN_PARAMS]
+                session.query(DescriptionMatch).filter(DescriptionMatch.description.in_(chunk)).update(
+                    {DescriptionMatch.matcher_id: matcher_id}, synchronize_session=False)
+
     def add_matcher(self, regexp, no_case, name):
         session = self.Session(expire_on_commit=False)
         try:
             rec = MatcherRule(regexp=regexp, no_case=no_case, account_name=name)
             session.add(rec)
+            session.flush()
+            self.apply_rules_to_memo(session, [rec])
             session.commit()
             return rec
         finally:
@@ -509,89 +1599,429 @@ class DataService:
     # Transaction file import
     # ------------------------------------------------------------------
     def add_unmapped_transaction_file(self, csv_path, external_id="UNSET"):
+        """
+        Import the file's raw rows only, without column mapping.
+        """
+        return self.import_transaction_file(csv_path, external_id, map_columns=False)
+
+    def reload_transactions(self, csv_path, external_id="UNSET", bulk=False,
+                            batch_size=BULK_BATCH_SIZE):
+        return self.load_transactions(csv_path, external_id, bulk, batch_size, force=True)
+
+    def load_transactions(self, csv_path, external_id="UNSET", bulk=False,
+                          batch_size=BULK_BATCH_SIZE, force=False):
+        """
+        Import a transaction CSV file. With bulk=True the transaction rows
+        are written with Core executemany inserts of batch_size rows each,
+        skipping the ORM unit of work, which matters on very large files.
+        Both paths bind through the same column types, so the stored
+        values are identical.
+        """
+        return self.import_transaction_file(csv_path, external_id, True, bulk, batch_size, force)
+
+    def import_transaction_file(self, csv_path, external_id="UNSET", map_columns=True,
+                                bulk=False, batch_size=BULK_BATCH_SIZE, force=False):
+        """
+        Stream a CSV file into the database, replacing any earlier import
+        of the same path. Rows are read RAW_PAGE_SIZE at a time, stored as
+        a raw page and, when a column map fits the header, parsed, matched
+        and added as transactions before the next page is read, so memory
+        use does not grow with the file. The whole import is one database
+        transaction.
+
+        The file's bytes are hashed first, a plain sequential read with no
+        parsing. Unless force is set, a file whose contents were already
+        imported, under this path or any other, is not imported again and
+        the existing record is returned.
+        """
         path = Path(csv_path).resolve()
-        with open(path) as f:
-            reader = csv.DictReader(f)
-            field_names = reader.fieldnames
-            rows = [dict(r) for r in reader]
-
+        content_hash = file_content_hash(path)
+        if not force:
+            existing = self.find_transaction_file_by_hash(content_hash, path)
+            if existing is not None:
+                return existing
+        engine = self.get_matcher() if map_columns else None
         session = self.Session(expire_on_commit=False)
         try:
-            # Remove any previous import of the same file
-            old = session.query(CCTransactionFile).filter_by(import_source_file=str(path)).first()
+            old = session.query(CCTransactionFile.id).filter_by(import_source_file=str(path)).first()
             if old:
-                session.delete(old)
-
-            file_rec = CCTransactionFile(external_id=external_id,
-                                         import_source_file=str(path))
-            file_rec._dataservice = self                     # <-- wire the service
-            session.add(file_rec)
+                self.delete_transaction_file(session, old.id)
+
+            with open(path) as f:
+                reader = csv.DictReader(f)
+                field_names = reader.fieldnames
+                file_rec = CCTransactionFile(external_id=external_id,
+                                             import_source_file=str(path),
+                                             content_hash=content_hash,
+                                             header_signature=header_signature(field_names))
+                file_rec._dataservice = self                     # <-- wire the service
+                cmap = None
+                if map_columns:
+                    cmap = self.find_column_map(session, field_names, file_rec.header_signature)
+                if cmap is not None:
+                    file_rec.column_map_id = cmap.id
+                session.add(file_rec)
+                session.flush()
+                session.add(CCTransactionsRaw(col_names_json=json.dumps(field_names),
+                                              file_id=file_rec.id))
+
+                pages = self.store_raw_pages(session, file_rec.id, reader)
+                if cmap is None:
+                    for first_row, rows in pages:
+                        session.flush()
+                        report_progress(len(rows))
+                else:
+                    self.add_transactions(session, file_rec.id, pages, cmap, engine,
+                                          bulk, batch_size)
+                    self.save_matcher_memo(session)
             session.commit()
+        finally:
+            session.close()
+        return file_rec
 
-            raw = CCTransactionsRaw(col_names_json=json.dumps(field_names),
-                                    rows_json=json.dumps(rows),
-                                    file_id=file_rec.id)
-            session.add(raw)
+    def store_raw_pages(self, session, file_id, reader):
+        """
+        Add each chunk of rows from the reader to the session as a raw page
+        and pass the chunk on as (first row number, rows). The rows are
+        added to the current job's total as they are read.
+        """
+        for first_row, rows in read_row_chunks(reader, RAW_PAGE_SIZE):
+            report_total(len(rows))
+            session.add(CCRawRowsPage(file_id=file_id,
+                                      first_row=first_row,
+                                      row_count=len(rows),
+                                      rows_data=CCRawRowsPage.pack_rows(rows)))
+            yield first_row, rows
+
+    def add_transactions(self, session, file_id, pages, cmap, engine,
+                         bulk=False, batch_size=BULK_BATCH_SIZE):
+        """
+        Parse and match (first row number, rows) pages with the column map
+        and add the resulting transactions to the session, flushing after
+        each page. With bulk=True they are written by Core executemany in
+        batches of batch_size rather than through the ORM.
+        """
+        insert_stmt = bulk_insert_transactions()
+        parser = self.get_row_parser(cmap)
+        batch = []
+        for first_row, rows in pages:
+            for values in parse_transaction_rows(rows, first_row, parser, engine):
+                values['file_id'] = file_id
+                if bulk:
+                    batch.append(values)
+                else:
+                    values['amount'] = cents_to_decimal(values.pop('amount_cents'))
+                    session.add(CCTransaction(**values))
+            if len(batch) >= batch_size:
+                session.execute(insert_stmt, batch)
+                batch = []
+            session.flush()
+            metrics.add_rows(len(rows))
+            report_progress(len(rows))
+        if batch:
+            session.execute(insert_stmt, batch)
+
+    def remap_transactions(self, transaction_file, bulk=False, batch_size=BULK_BATCH_SIZE):
+        """
+        Rebuild the file's transactions from its stored raw pages with
+        whichever column map now fits its header, without reading the CSV
+        file again. A file no map fits is left unmapped, and a file with no
+        stored raw data at all is an error rather than being mapped empty.
+        A header only file is mapped with no transactions.
+        """
+        engine = self.get_matcher()
+        session = self.Session(expire_on_commit=False)
+        try:
+            file_rec = session.query(CCTransactionFile).filter_by(id=transaction_file.id).first()
+            raw = session.query(CCTransactionsRaw).filter_by(file_id=file_rec.id).first()
+            if raw is None:
+                raise Exception(f"cannot remap file {file_rec.import_source_file}, "
+                                f"no raw data is stored for it")
+            file_rec.header_signature = header_signature(raw.get_col_names())
+            cmap = self.find_column_map(session, raw.get_col_names(), file_rec.header_signature)
+            if cmap is not None and current_job() is not None:
+                report_total(session.query(func.coalesce(func.sum(CCRawRowsPage.row_count), 0))
+                             .filter(CCRawRowsPage.file_id == file_rec.id).scalar())
+            session.query(CCTransaction).filter(CCTransaction.file_id == file_rec.id).delete(
+                synchronize_session=False)
+            file_rec.column_map_id = cmap.id if cmap is not None else None
+            if cmap is not None:
+                self.add_transactions(session, file_rec.id, self.read_raw_pages(session, file_rec.id),
+                                      cmap, engine, bulk, batch_size)
+                self.save_matcher_memo(session)
             session.commit()
         finally:
             session.close()
         return file_rec
 
-    def reload_transactions(self, csv_path, external_id="UNSET"):
+    def read_raw_pages(self, session, file_id, start=0, stop=None):
+        """
+        Yield (first row number, rows) for the file's stored pages that hold
+        any row numbered from start up to, not including, stop, decoding
+        one page at a time.
+        """
+        q = (session.query(CCRawRowsPage.id)
+             .filter(CCRawRowsPage.file_id == file_id)
+             .filter(CCRawRowsPage.first_row + CCRawRowsPage.row_count > start))
+        if stop is not None:
+            q = q.filter(CCRawRowsPage.first_row < stop)
+        page_ids = [page_id for page_id, in q.order_by(CCRawRowsPage.first_row)]
+        for page_id in page_ids:
+            page = session.query(CCRawRowsPage).filter_by(id=page_id).first()
+            yield page.first_row, page.get_rows()
+            session.expunge(page)
+
+    def find_transaction_file_by_hash(self, content_hash, path=None):
+        """
+        Return the file record imported with these contents, preferring one
+        imported from path, or None. Records from before content hashes were
+        kept have none and never match, so importing their path again
+        replaces them as it always did.
+        """
+        if content_hash is None:
+            return None
+        session = self.Session(expire_on_commit=False)
+        try:
+            q = session.query(CCTransactionFile).filter(CCTransactionFile.content_hash == content_hash)
+            if path is not None:
+                q = q.order_by((CCTransactionFile.import_source_file == str(path)).desc())
+            return q.first()
+        finally:
+            session.close()
+
+    def get_row_parser(self, cmap):
+        parser = self.row_parsers.get(cmap.id)
+        if parser is None or parser.date_format != cmap.date_format:
+            parser = self.row_parsers[cmap.id] = RowParser(cmap)
+        return parser
+
+    def import_directory(self, dir_path, pattern="*.csv", workers=None,
+                         external_id="UNSET", batch_size=BULK_BATCH_SIZE):
+        """
+        Import every file in the directory matching pattern. Hashing, CSV
+        parsing, date conversion and matching run in a pool of workers
+        processes (default one per core), and this process writes each
+        parsed file to the database as it arrives, so there is a single
+        writer. Files whose contents were already imported are skipped as
+        load_transactions would. Returns an ImportResult per file, sorted by
+        path, holding the file record or the error for that file.
+        """
+        paths = sorted(Path(dir_path).resolve().glob(pattern))
         session = self.Session()
         try:
-            rec = session.query(CCTransactionFile).filter_by(import_source_file=str(csv_path)).first()
-            if rec:
-                session.delete(rec)
-            session.commit()
+            index = self.get_column_map_index(session)
+            column_maps = [dict(id=c.id, map_name=c.map_name, date_column=c.date_column,
+                                description_column=c.description_column,
+                                amount_column=c.amount_column, date_format=c.date_format)
+                           for c in index.maps.values()]
+            signatures = dict(index.signatures)
+            rules = [dict(id=r.id, regexp=r.regexp, no_case=r.no_case)
+                     for r in session.query(MatcherRule).order_by(MatcherRule.id)]
+            memo = self.get_matcher()
+            memo_entries = list(memo.entries.items())
+            known_hashes = frozenset(h for h, in session.query(CCTransactionFile.content_hash)
+                                     if h is not None)
         finally:
             session.close()
-        return self.load_transactions(csv_path, external_id)
 
-    def load_transactions(self, csv_path, external_id="UNSET"):
-        file_rec = self.add_unmapped_transaction_file(csv_path, external_id)
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_import_worker,
+                                 initargs=(column_maps, signatures, rules, memo_entries,
+                                           known_hashes, str(self.ops_dir))) as pool:
+            futures = {pool.submit(parse_transaction_file, path): path for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    parsed = future.result()
+                    # the worker counted the rows, so each file joins the total when parsed
+                    report_total(parsed.get('rows', 0))
+                    file_rec = self.store_parsed_file(parsed, external_id, batch_size)
+                    results[path] = ImportResult(path, file_rec=file_rec)
+                except JobCancelled:
+                    # files already stored stay, the rest are not parsed or are thrown away
+                    for other in futures:
+                        if other is not future and futures[other] not in results and not other.cancel():
+                            discard_parsed_file(other)
+                    raise
+                except Exception as e:
+                    results[path] = ImportResult(path, error=e)
+        return [results[path] for path in paths]
+
+    def store_parsed_file(self, parsed, external_id="UNSET", batch_size=BULK_BATCH_SIZE):
+        """
+        Write a file parsed by parse_transaction_file to the database,
+        replacing any earlier import of the same path, in one transaction.
+        Pages are read back from the spool file and inserted one at a time,
+        and the spool file is removed.
+        """
+        path = parsed['path']
+        try:
+            existing = self.find_transaction_file_by_hash(parsed['content_hash'], path)
+            if existing is not None:
+                return existing
+            return self.store_spooled_file(parsed, external_id, batch_size)
+        finally:
+            if parsed.get('spool_path'):
+                Path(parsed['spool_path']).unlink(missing_ok=True)
+
+    def store_spooled_file(self, parsed, external_id, batch_size):
+        path = parsed['path']
+        insert_stmt = bulk_insert_transactions()
+        memo = self.get_matcher()
         session = self.Session(expire_on_commit=False)
         try:
-            raw = session.query(CCTransactionsRaw).filter_by(file_id=file_rec.id).first()
-            columns = raw.get_col_names()
-            # Auto-detect column map
-            for cmap in session.query(ColumnMap):
-                if (cmap.date_column in columns and
-                    cmap.description_column in columns and
-                    cmap.amount_column in columns):
-                    file_rec.column_map_id = cmap.id
-                    session.add(file_rec)
-                    break
-            else:
-                return file_rec                               # no map → stop here
-
-            rows = raw.get_rows()
-            matchers = self.get_matchers()
-
-            for index,row in enumerate(rows):
-                desc = row[cmap.description_column]
-                date = datetime.strptime(row[cmap.date_column], cmap.date_format)
-                amount = Decimal(row[cmap.amount_column])
-                is_payment = amount > 0
-
-                matcher_id = None
-                for m in matchers:
-                    if m.compiled.match(desc):
-                        matcher_id = m.id
-                        break
-
-                session.add(CCTransaction(date=date,
-                                          description=desc,
-                                          amount=amount,
-                                          is_payment=is_payment,
-                                          file_id=file_rec.id,
-                                          matcher_id=matcher_id,
-                                          raw_row_number=index))
+            old = session.query(CCTransactionFile.id).filter_by(import_source_file=str(path)).first()
+            if old:
+                self.delete_transaction_file(session, old.id)
+            file_rec = CCTransactionFile(external_id=external_id,
+                                         import_source_file=str(path),
+                                         content_hash=parsed['content_hash'],
+                                         header_signature=parsed['header_signature'],
+                                         column_map_id=parsed['column_map_id'])
+            index = self.get_column_map_index(session)
+            if parsed['header_signature'] not in index.signatures:
+                index.signatures[parsed['header_signature']] = parsed['column_map_id']
+                self.record_header_signature(session, parsed['header_signature'],
+                                             parsed['field_names'], parsed['column_map_id'])
+            file_rec._dataservice = self                     # <-- wire the service
+            session.add(file_rec)
+            session.flush()
+            session.add(CCTransactionsRaw(col_names_json=json.dumps(parsed['field_names']),
+                                          file_id=file_rec.id))
+            batch = []
+            for first_row, row_count, rows_data, xactions in read_spooled_pages(parsed['spool_path']):
+                session.add(CCRawRowsPage(file_id=file_rec.id, first_row=first_row,
+                                          row_count=row_count, rows_data=rows_data))
+                session.flush()
+                for values in xactions:
+                    memo.remember(values['description'], values['matcher_id'])
+                    values['file_id'] = file_rec.id
+                batch.extend(xactions)
+                if len(batch) >= batch_size:
+                    session.execute(insert_stmt, batch)
+                    batch = []
+                metrics.add_rows(len(xactions))
+                report_progress(row_count)
+            if batch:
+                session.execute(insert_stmt, batch)
+            self.save_matcher_memo(session)
             session.commit()
         finally:
             session.close()
         return file_rec
 
+    def delete_transaction_file(self, session, file_id):
+        """
+        Delete a file record and everything imported from it, with bulk
+        deletes since SQLite is not enforcing the foreign key cascades.
+        """
+        for model in (CCTransaction, CCRawRowsPage, CCTransactionsRaw):
+            session.query(model).filter(model.file_id == file_id).delete(synchronize_session=False)
+        session.query(CCTransactionFile).filter(CCTransactionFile.id == file_id).delete(
+            synchronize_session=False)
+
+    def iter_raw_rows(self, transaction_file):
+        """
+        Yield the file's raw CSV rows in order, decoding one page at a time.
+        """
+        session = self.Session()
+        try:
+            for first_row, rows in self.read_raw_pages(session, transaction_file.id):
+                yield from rows
+        finally:
+            session.close()
+
+    def get_raw_rows(self, transaction_file, start=0, count=None):
+        """
+        Return up to count raw CSV rows of the file beginning with row number
+        start, decoding only the pages that hold them.
+        """
+        stop = None if count is None else start + count
+        res = []
+        session = self.Session()
+        try:
+            for first_row, rows in self.read_raw_pages(session, transaction_file.id, start, stop):
+                lo = max(start - first_row, 0)
+                hi = len(rows) if stop is None else min(stop - first_row, len(rows))
+                res.extend(rows[lo:hi])
+        finally:
+            session.close()
+        return res
+
+    def get_raw_row(self, transaction_file, row_number):
+        rows = self.get_raw_rows(transaction_file, row_number, 1)
+        return rows[0] if rows else None
+
+    def get_raw_rows_by_number(self, transaction_file, row_numbers):
+        """
+        Return {row number: raw row} for the requested row numbers,
+        decoding each page that holds any of them once.
+        """
+        session = self.Session()
+        try:
+            pages = list(session.query(CCRawRowsPage.id, CCRawRowsPage.first_row)
+                         .filter(CCRawRowsPage.file_id == transaction_file.id)
+                         .order_by(CCRawRowsPage.first_row))
+            starts = [first_row for page_id, first_row in pages]
+            wanted = {}
+            for number in row_numbers:
+                index = bisect.bisect_right(starts, number) - 1
+                if index >= 0:
+                    wanted.setdefault(index, []).append(number)
+            res = {}
+            for index, numbers in wanted.items():
+                page_id, first_row = pages[index]
+                page = session.query(CCRawRowsPage).filter_by(id=page_id).first()
+                rows = page.get_rows()
+                for number in numbers:
+                    if number - first_row < len(rows):
+                        res[number] = rows[number - first_row]
+                session.expunge(page)
+        finally:
+            session.close()
+        return res
+
+    def get_transaction_page(self, transaction_file, offset=0, limit=100,
+                             matched=None, sort_by="row", descending=False):
+        """
+        Return (total, rows) for one page of a file view. rows holds
+        (row number, matched, raw row) for at most limit rows after skipping
+        offset. For a mapped file matched is True or False, the filtering on
+        it (matched=True or False, None for all) and the sort (one of
+        TRANSACTION_SORT_KEYS) are done in SQL and only the raw pages behind
+        the returned rows are decoded. An unmapped file has no transactions
+        to filter or sort on, so its rows come in file order with matched
+        None.
+        """
+        if not transaction_file.columns_mapped:
+            session = self.Session()
+            try:
+                total = session.query(func.coalesce(func.sum(CCRawRowsPage.row_count), 0)).filter(
+                    CCRawRowsPage.file_id == transaction_file.id).scalar()
+            finally:
+                session.close()
+            rows = self.get_raw_rows(transaction_file, offset, limit)
+            return total, [(offset + index, None, row) for index, row in enumerate(rows)]
+
+        session = self.Session()
+        try:
+            q = (session.query(CCTransaction.raw_row_number, CCTransaction.matcher_id)
+                 .filter(CCTransaction.file_id == transaction_file.id))
+            if matched is True:
+                q = q.filter(CCTransaction.matcher_id.isnot(None))
+            elif matched is False:
+                q = q.filter(CCTransaction.matcher_id.is_(None))
+            total = q.count()
+            sort_col = getattr(CCTransaction, TRANSACTION_SORT_KEYS[sort_by])
+            order = [sort_col.desc() if descending else sort_col.asc()]
+            if sort_by != "row":
+                order.append(CCTransaction.raw_row_number)
+            page = list(q.order_by(*order).offset(offset).limit(limit))
+        finally:
+            session.close()
+        raw = self.get_raw_rows_by_number(transaction_file, [number for number, mid in page])
+        return total, [(number, mid is not None, raw.get(number, {})) for number, mid in page]
+
     # ------------------------------------------------------------------
     # Query helpers
     # ------------------------------------------------------------------
@@ -607,6 +2037,102 @@ class DataService:
         finally:
             session.close()
 
+    def file_row_counts(self, session, file_ids=None, unsaved_only=False):
+        q = (session.query(CCTransactionFile.id,
+                           CCTransactionFile.column_map_id,
+                           func.count(CCTransaction.id),
+                           func.count(CCTransaction.matcher_id))
+             .outerjoin(CCTransaction, CCTransaction.file_id == CCTransactionFile.id)
+             .group_by(CCTransactionFile.id))
+        if unsaved_only:
+            q = q.filter(CCTransactionFile.saved_to_gnucash == False)
+        if file_ids is not None:
+            q = q.filter(CCTransactionFile.id.in_(file_ids))
+        return list(q)
+
+    def get_row_counts(self, file_ids=None):
+        """
+        Return {file_id: (matched, unmatched)} computed with one GROUP BY
+        query instead of loading the transactions.
+        """
+        session = self.Session()
+        try:
+            return {file_id: (matched, total - matched)
+                    for file_id, map_id, total, matched in self.file_row_counts(session, file_ids)}
+        finally:
+            session.close()
+
+    def get_status(self):
+        """
+        Compute the counts that drive MainFlow's next step decisions with
+        two aggregate queries, one over the unsaved files and their rows,
+        one over the matcher rules joined to the accounts they name.
+        """
+        status = DataStatus()
+        session = self.Session()
+        try:
+            for file_id, map_id, total, matched in self.file_row_counts(session, unsaved_only=True):
+                status.pending_files += 1
+                if map_id is None:
+                    status.unmapped_files += 1
+                else:
+                    status.mapped_files += 1
+                if total > matched:
+                    status.files_with_unmatched += 1
+                status.matched_rows += matched
+                status.unmatched_rows += total - matched
+                status.file_rows[file_id] = (matched, total - matched)
+
+            q = (session.query(MatcherRule.account_name, Account.id, Account.in_gnucash)
+                 .outerjoin(Account, Account.name == MatcherRule.account_name))
+            missing = set()
+            unsynced = set()
+            for name, account_id, in_gnucash in q:
+                if account_id is None:
+                    missing.add(name)
+                elif not in_gnucash:
+                    unsynced.add(name)
+            status.missing_accounts = sorted(missing)
+            status.unsynced_accounts = sorted(unsynced)
+        finally:
+            session.close()
+        return status
+
+    def get_save_readiness(self, file_ids=None):
+        """
+        Return {file_id: [blocking transaction ids]} for the given files,
+        or for every unsaved file. A row blocks saving when it has no
+        matcher or its matcher's account is missing or not yet in the
+        GnuCash file, so a file is ready when its list is empty. Found with
+        one join across transactions, matcher rules and accounts.
+        """
+        session = self.Session()
+        try:
+            q = session.query(CCTransactionFile.id)
+            if file_ids is None:
+                q = q.filter(CCTransactionFile.saved_to_gnucash == False)
+            else:
+                q = q.filter(CCTransactionFile.id.in_(file_ids))
+            res = {file_id: [] for file_id, in q}
+
+            q = (session.query(CCTransaction.file_id, CCTransaction.id)
+                 .join(CCTransactionFile, CCTransaction.file_id == CCTransactionFile.id)
+                 .outerjoin(MatcherRule, MatcherRule.id == CCTransaction.matcher_id)
+                 .outerjoin(Account, Account.name == MatcherRule.account_name)
+                 .filter(or_(CCTransaction.matcher_id.is_(None),
+                             Account.id.is_(None),
+                             Account.in_gnucash.isnot(True)))
+                 .order_by(CCTransaction.id))
+            if file_ids is None:
+                q = q.filter(CCTransactionFile.saved_to_gnucash == False)
+            else:
+                q = q.filter(CCTransactionFile.id.in_(file_ids))
+            for file_id, xact_id in q:
+                res[file_id].append(xact_id)
+        finally:
+            session.close()
+        return res
+
     def get_transactions(self, transaction_file):
         session = self.Session(expire_on_commit=False)
         try:
@@ -624,35 +2150,135 @@ class DataService:
         finally:
             session.close()
 
+    def match_unmatched_transactions(self, rules=None):
+        """
+        Test the transactions that have no matcher, in files not yet saved
+        to GnuCash, against rules (default all rules) and record the winner
+        in place, one UPDATE per winning rule. When rules are newly added
+        ones this gives the same result as a full re-import, since every
+        older rule already failed to match these rows. Returns the number
+        of transactions that gained a matcher.
+        """
+        if rules is None:
+            engine = self.get_matcher()
+        else:
+            engine = MatcherEngine(rules)
+        session = self.Session()
+        try:
+            q = (session.query(CCTransaction.id, CCTransaction.description)
+                 .join(CCTransactionFile, CCTransaction.file_id == CCTransactionFile.id)
+                 .filter(CCTransaction.matcher_id.is_(None))
+                 .filter(CCTransactionFile.saved_to_gnucash == False))
+            by_rule = {}
+            scanned = 0
+            for xact_id, desc in q:
+                scanned += 1
+                if scanned % RAW_PAGE_SIZE == 0:
+                    report_progress(RAW_PAGE_SIZE)
+                matcher_id = engine.match(desc)
+                if matcher_id is not None:
+                    by_rule.setdefault(matcher_id, []).append(xact_id)
+            report_progress(scanned % RAW_PAGE_SIZE)
+            metrics.add_rows(scanned)
+            count = 0
+            for matcher_id, xact_ids in by_rule.items():
+                for start in range(0, len(xact_ids), MAX_IN_PARAMS):
+                    chunk = xact_ids[start:start + MAX_IN_PARAMS]
+                    session.query(CCTransaction).filter(CCTransaction.id.in_(chunk)).update(
+                        {CCTransaction.matcher_id: matcher_id}, synchronize_session=False)
+                count += len(xact_ids)
+            if rules is None:
+                self.save_matcher_memo(session)
+            session.commit()
+        finally:
+            session.close()
+        return count
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    REPORT_GROUPS = ("account", "file", "month", "kind")
+
+    def report_totals(self, group_by="account", start_date=None, end_date=None,
+                      file_ids=None):
+        """
+        Return ReportTotal rows with the transaction count and amount total
+        for each group, summed in SQL over the stored cents. group_by is
+        one of REPORT_GROUPS or a sequence of them:
+
+        account -- matcher rule account name, None for unmatched rows
+        file    -- transaction file id
+        month   -- "YYYY-MM" of the transaction date
+        kind    -- "payment" or "charge"
+
+        start_date and end_date are inclusive, and file_ids limits the
+        report to those files. Rows are ordered by key.
+        """
+        if isinstance(group_by, str):
+            groups = [group_by]
+        else:
+            groups = list(group_by)
+        columns = []
+        for group in groups:
+            if group == "account":
+                columns.append(MatcherRule.account_name)
+            elif group == "file":
+                columns.append(CCTransaction.file_id)
+            elif group == "month":
+                columns.append(func.strftime('%Y-%m', CCTransaction.date))
+            elif group == "kind":
+                columns.append(CCTransaction.is_payment)
+            else:
+                raise Exception(f"unknown report group {group}, expected one of {self.REPORT_GROUPS}")
+        session = self.Session()
+        try:
+            query = session.query(*columns,
+                                  func.count(CCTransaction.id),
+                                  func.coalesce(func.sum(CCTransaction.amount.cents), 0))
+            if "account" in groups:
+                query = query.outerjoin(MatcherRule, MatcherRule.id == CCTransaction.matcher_id)
+            if start_date is not None:
+                query = query.filter(CCTransaction.date >= start_date)
+            if end_date is not None:
+                query = query.filter(CCTransaction.date <= end_date)
+            if file_ids is not None:
+                query = query.filter(CCTransaction.file_id.in_(file_ids))
+            res = []
+            for row in query.group_by(*columns).order_by(*columns):
+                keys = list(row[:len(groups)])
+                for index, group in enumerate(groups):
+                    if group == "kind":
+                        keys[index] = "payment" if keys[index] else "charge"
+                key = keys[0] if len(groups) == 1 else tuple(keys)
+                res.append(ReportTotal(key=key, count=row[-2], cents=row[-1]))
+            return res
+        finally:
+            session.close()
+
     # ------------------------------------------------------------------
     # Standardisation / export
     # ------------------------------------------------------------------
     def standardize_transactions(self, file_rec, output_path=None,
                                  include_payments=False, payments_account=None):
-        recs = self.get_transactions(file_rec)
-        session = self.Session()
         rows = []
-        try:
-            for rec in recs:
-                if rec.matcher_id is None:
-                    if not rec.is_payment:
-                        raise Exception(f"cannot standardize file {file_rec.import_source_file}, "
-                                        f"unmatched desc {rec.description}")
-                    if not include_payments:
-                        continue
-                    acct = ""
-                else:
-                    matcher = session.query(MatcherRule).filter_by(id=rec.matcher_id).first()
-                    acct = matcher.account_name
+        for rec in self.get_transactions_with_accounts(file_rec):
+            if rec.matcher_id is None:
+                if not rec.is_payment:
+                    raise Exception(f"cannot standardize file {file_rec.import_source_file}, "
+                                    f"unmatched desc {rec.description}")
+                if not include_payments:
+                    continue
+                acct = ""
+            else:
+                acct = rec.account_name
 
-                rows.append({
-                    'Date': rec.date,
-                    'Description': rec.description,
-                    'Amount': rec.amount,
-                    'GnucashAccount': acct,
-                })
-        finally:
-            session.close()
+            rows.append({
+                'Date': rec.date,
+                'Description': rec.description,
+                'Amount': cents_to_decimal(rec.amount_cents),
+                'GnucashAccount': acct,
+            })
+        metrics.add_rows(len(rows))
 
         if output_path:
             with open(output_path, 'w', newline='') as f:
@@ -671,64 +2297,118 @@ class DataService:
     # ------------------------------------------------------------------
     def do_cc_transactions(self, file_rec_in, cc_name,
                            include_payments=False, payments_name=None):
-        def do_charge(rec, book, cc_account, expense_account):
-            usd = book.commodities(mnemonic="USD")
-            Transaction(
-                currency=usd,
-                post_date=rec.date,
-                description=rec.description,
-                splits=[
-                    Split(account=cc_account, value=rec.amount),
-                    Split(account=expense_account, value=-rec.amount)
-                ]
-            )
+        """
+        Post the file's transactions to the GnuCash book and return the
+        resulting balances of every account touched. Matcher accounts are
+        resolved with one query, the piecash accounts are looked up once
+        each, and balances are computed once after all splits are added.
+        """
+        if include_payments and payments_name is None:
+            raise Exception("payments_name required when include_payments=True")
+
+        with self.use_gnucash_session() as gc_session:
+            poster = BookPoster(gc_session.book)
+            poster.get_account(cc_name)
+            if include_payments:
+                poster.get_account(payments_name)
+            rows = self.get_transactions_with_accounts(file_rec_in)
+            report_total(len(rows))
+            poster.post_file(rows, cc_name, include_payments, payments_name)
+            balances = {name: account.get_balance() for name, account in poster.accounts.items()}
+            gc_session.after_commit(lambda: self.mark_files_saved([file_rec_in.id]))
+        return balances
 
-        def do_payment(rec, book, cc_account, payments_account):
-            usd = book.commodities(mnemonic="USD")
-            Transaction(
-                currency=usd,
-                post_date=rec.date,
-                description="Payment",
-                splits=[
-                    Split(account=payments_account, value=-rec.amount),
-                    Split(account=cc_account, value=rec.amount)
-                ]
-            )
+    def post_transaction_files(self, postings, include_payments=False, payments_name=None):
+        """
+        Post several files to the GnuCash book in one session with a single
+        save, so either every file is written or, if any fails, none is.
+        postings is a list of (file record, credit card account name) pairs
+        and every file must be save ready. Returns {file_id: {account name:
+        change in balance}} for each file.
+        """
+        if include_payments and payments_name is None:
+            raise Exception("payments_name required when include_payments=True")
+        readiness = self.get_save_readiness([file_rec.id for file_rec, cc_name in postings])
+        for file_rec, cc_name in postings:
+            if readiness[file_rec.id]:
+                raise Exception(f'cannot save file {file_rec.import_source_file}, not ready')
+
+        deltas = {}
+        with self.use_gnucash_session() as gc_session:
+            poster = BookPoster(gc_session.book)
+            file_rows = [self.get_transactions_with_accounts(file_rec) for file_rec, cc_name in postings]
+            report_total(sum(len(rows) for rows in file_rows))
+            for (file_rec, cc_name), rows in zip(postings, file_rows):
+                deltas[file_rec.id] = poster.post_file(rows, cc_name, include_payments, payments_name)
+            file_ids = list(deltas)
+            gc_session.after_commit(lambda: self.mark_files_saved(file_ids))
+        return deltas
+
+    def get_transactions_with_accounts(self, transaction_file):
+        """
+        Return the file's transactions in row order as rows with id, date,
+        description, amount_cents, is_payment, matcher_id and account_name,
+        the last None for rows that have no matcher. The amount is left as
+        the stored integer cents.
+        """
+        session = self.Session()
+        try:
+            return list(session.query(CCTransaction.id,
+                                      CCTransaction.date,
+                                      CCTransaction.description,
+                                      CCTransaction.amount.cents.label('amount_cents'),
+                                      CCTransaction.is_payment,
+                                      CCTransaction.matcher_id,
+                                      MatcherRule.account_name)
+                        .outerjoin(MatcherRule, MatcherRule.id == CCTransaction.matcher_id)
+                        .filter(CCTransaction.file_id == transaction_file.id)
+                        .order_by(CCTransaction.id))
+        finally:
+            session.close()
 
-        balances = {}
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", category=sa_exc.SAWarning)
-            with open_book(str(self.gnucash_path), readonly=False) as book:
-                cc_account = book.accounts(fullname=cc_name)
-                session = self.Session()
-                try:
-                    file_rec = session.query(CCTransactionFile).filter_by(id=file_rec_in.id).first()
-                    recs = self.get_transactions(file_rec)
-
-                    payments_account = None
-                    if include_payments:
-                        if payments_name is None:
-                            raise Exception("payments_name required when include_payments=True")
-                        payments_account = book.accounts(fullname=payments_name)
-
-                    for rec in recs:
-                        if rec.is_payment:
-                            if include_payments:
-                                do_payment(rec, book, cc_account, payments_account)
-                            continue
-
-                        matcher = session.query(MatcherRule).filter_by(id=rec.matcher_id).first()
-                        exp_account = book.accounts(fullname=matcher.account_name)
-                        do_charge(rec, book, cc_account, exp_account)
-                        balances[matcher.account_name] = exp_account.get_balance()
-
-                    balances[cc_name] = cc_account.get_balance()
-                    if payments_account:
-                        balances[payments_name] = payments_account.get_balance()
-
-                    file_rec.saved_to_gnucash = True
-                    session.commit()
-                finally:
-                    session.close()
-                    book.save()
-        return balances
+    # ------------------------------------------------------------------
+    # Job history
+    # ------------------------------------------------------------------
+    def save_job(self, job):
+        """
+        Write a ctrack.jobs.Job's state to the jobs table with one upsert,
+        giving it an id first if it has none.
+        """
+        values = dict(kind=job.kind, description=job.description, created=job.created,
+                      state=job.state, rows_done=job.rows_done, rows_total=job.rows_total,
+                      started=job.started, finished=job.finished, error=job.error)
+        if job.id is not None:
+            values['id'] = job.id
+        stmt = sqlite_insert(JobRecord.__table__).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=['id'],
+                                          set_={key: stmt.excluded[key] for key in values
+                                                if key != 'id'})
+        with self.engine.begin() as conn:
+            result = conn.execute(stmt)
+        if job.id is None:
+            job.id = result.inserted_primary_key[0]
+
+    def get_job_history(self, limit=50):
+        session = self.Session(expire_on_commit=False)
+        try:
+            return list(session.query(JobRecord).order_by(JobRecord.id.desc()).limit(limit))
+        finally:
+            session.close()
+
+    def fail_interrupted_jobs(self):
+        session = self.Session()
+        try:
+            session.query(JobRecord).filter(JobRecord.state.in_(("pending", "running"))).update(
+                {JobRecord.state: "failed", JobRecord.error: "interrupted"}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def mark_files_saved(self, file_ids):
+        session = self.Session()
+        try:
+            session.query(CCTransactionFile).filter(CCTransactionFile.id.in_(file_ids)).update(
+                {CCTransactionFile.saved_to_gnucash: True}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
@@ -1,6 +1,7 @@
 from pathlib import Path
 from enum import StrEnum, auto
 from ctrack.data_service import DataService
+from ctrack.metrics import instrumented
 
 
 
@@ -21,11 +22,12 @@ class NextStep(StrEnum):
     DO_ACCOUNT_SYNC = auto()
     SAVE_XACTIONS = auto()
     
+@instrumented
 class MainFlow:
 
-    def __init__(self, data_dir, gnucash_path=None):
+    def __init__(self, data_dir, gnucash_path=None, engine_profile=None):
         self.data_dir = Path(data_dir)
-        self.dataservice = DataService(self.data_dir)
+        self.dataservice = DataService(self.data_dir, engine_profile)
         if gnucash_path is not None:
             self.dataservice.set_gnucash_file(gnucash_path)
         self.gnucash_path = self.dataservice.gnucash_path
@@ -35,7 +37,8 @@ class MainFlow:
         return self.dataservice.get_transaction_files(unsaved_only=True)
     
     def get_next_step(self):
-        needs = self.get_data_needs()
+        status = self.dataservice.get_status()
+        needs = self.get_data_needs(status)
         if DataNeeded.GNUCASH in needs:
             return NextStep.SET_GNUCASH
         if DataNeeded.XACTION_FILE in needs:
@@ -48,9 +51,8 @@ class MainFlow:
             return NextStep.ADD_ACCOUNT
         if DataNeeded.ACCOUNT_SYNC in needs:
             return NextStep.DO_ACCOUNT_SYNC
-        for xfile in self.pending_xaction_files:
-            if xfile.saved_to_gnucash is False:
-                return NextStep.SAVE_XACTIONS
+        if status.pending_files > 0:
+            return NextStep.SAVE_XACTIONS
         return NextStep.LOAD_XACTION_FILE
         
     def set_gnucash(self, path):
@@ -60,18 +62,19 @@ class MainFlow:
     def add_xaction_file(self, path):
         file_rec = self.dataservice.load_transactions(path)
 
+    def add_xaction_dir(self, path, pattern="*.csv", workers=None):
+        return self.dataservice.import_directory(path, pattern, workers)
+
     def add_column_map(self, name, date_col, desc_col, amount_col, date_format):
-        self.dataservice.add_column_map(name, date_col, desc_col, amount_col, date_format)
-        for xfile in self.pending_xaction_files:
-            if not xfile.columns_mapped:
-                xfile = self.dataservice.reload_transactions(xfile.import_source_file)
+        cmap = self.dataservice.add_column_map(name, date_col, desc_col, amount_col, date_format)
+        for xfile in self.dataservice.get_files_for_column_map(cmap):
+            self.dataservice.remap_transactions(xfile)
+        return cmap
 
     def add_matcher_rule(self, regexp, no_case, account_name):
-        self.dataservice.add_matcher(regexp, no_case, account_name)
-        for xfile in self.pending_xaction_files:
-            matched, unmatched = xfile.rows_matched()
-            if unmatched > 0:
-                xfile = self.dataservice.reload_transactions(xfile.import_source_file)
+        rule = self.dataservice.add_matcher(regexp, no_case, account_name)
+        self.dataservice.match_unmatched_transactions([rule])
+        return rule
 
     def add_account(self, name, description, save=False):
         account = self.dataservice.add_account(name, description)
@@ -80,61 +83,59 @@ class MainFlow:
         return account
 
     def load_matcher_rules_file(self, path):
-        self.dataservice.load_matcher_file(path)
-        for xfile in self.pending_xaction_files:
-            matched, unmatched = xfile.rows_matched()
-            if unmatched > 0:
-                xfile = self.dataservice.reload_transactions(xfile.import_source_file)
+        rules = self.dataservice.load_matcher_file(path)
+        self.dataservice.match_unmatched_transactions(rules)
         
-    def get_data_needs(self):
+    def get_data_needs(self, status=None):
+        if status is None:
+            status = self.dataservice.get_status()
         res = set()
         if self.gnucash_path is None:
             res.add(DataNeeded.GNUCASH)
-        if len(self.pending_xaction_files) == 0:
+        if status.pending_files == 0:
             res.add(DataNeeded.XACTION_FILE)
         else:
-            for x_file in self.pending_xaction_files:
-                if not x_file.columns_mapped:
-                    res.add(DataNeeded.COLUMN_MAP)
-                matched, unmatched = x_file.rows_matched()
-                if unmatched > 0:
-                    res.add(DataNeeded.MATCHER_RULE)
-        for rule in self.dataservice.get_matchers():
-            has_accnt, accnt_saved = rule.account_status(self.dataservice)
-            if not has_accnt:
-                res.add(DataNeeded.ACCOUNT)
-            elif not accnt_saved:
-                res.add(DataNeeded.ACCOUNT_SYNC)
+            if status.unmapped_files > 0:
+                res.add(DataNeeded.COLUMN_MAP)
+            if status.files_with_unmatched > 0:
+                res.add(DataNeeded.MATCHER_RULE)
+        if status.missing_accounts:
+            res.add(DataNeeded.ACCOUNT)
+        if status.unsynced_accounts:
+            res.add(DataNeeded.ACCOUNT_SYNC)
         return list(res)      
 
     def get_unfinished_xactions(self):
+        status = self.dataservice.get_status()
         unmapped = []
         unmatched = []
         for x_file in self.pending_xaction_files:
             if not x_file.columns_mapped:
                 unmapped.append(x_file)
-            matched, no_match = x_file.rows_matched()
+            matched, no_match = status.file_rows.get(x_file.id, (0, 0))
             if no_match > 0:
                 unmatched.append(x_file)
         return unmapped, unmatched
 
     def get_savable_xactions(self):
-        res = []
-        for x_file in self.pending_xaction_files:
-            if x_file.saved_to_gnucash:
-                continue
-            if x_file.is_save_ready():
-                res.append(x_file)
-        return res
+        readiness = self.dataservice.get_save_readiness()
+        return [x_file for x_file in self.pending_xaction_files
+                if not readiness.get(x_file.id)]
     
+    def save_xactions(self, cc_account_name, payments_account_name, cc_account_names=None):
+        """
+        Post every save ready pending file to the GnuCash file in one book
+        session, writing none of them if any fails. cc_account_names can map
+        file ids to the credit card account for that file, others use
+        cc_account_name. Returns the per file balance changes.
+        """
+        if cc_account_names is None:
+            cc_account_names = {}
+        postings = [(x_file, cc_account_names.get(x_file.id, cc_account_name))
+                    for x_file in self.get_savable_xactions()]
+        return self.dataservice.post_transaction_files(postings, True, payments_account_name)
+
     def get_missing_accounts(self):
-        missing = []
-        unsaved = []
-        for rule in self.dataservice.get_matchers():
-            has_accnt, accnt_saved = rule.account_status(self.dataservice)
-            if not has_accnt:
-                missing.append(rule.account_name)
-            elif not accnt_saved:
-                unsaved.append(rule.account_name)
-        return missing, unsaved
+        status = self.dataservice.get_status()
+        return status.missing_accounts, status.unsynced_accounts
     
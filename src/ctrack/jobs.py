@@ -0,0 +1,278 @@
+"""
+Background jobs for long DataService and MainFlow operations.
+
+A JobManager runs submitted jobs one at a time on a worker thread. The
+operations report progress from inside their batch loops with
+report_progress, which is also where a cancelled job stops: it raises
+JobCancelled, and the operation's transaction or GnuCash session is
+rolled back as for any other error. Subscribers are called with the Job
+on every change.
+
+Job state is kept in the jobs table of ctrack.db through the DataService,
+written by a saver thread of the JobManager rather than by the thread
+that changed it. A running import holds SQLite's write lock until it
+commits, so a write from its own thread would wait on itself; the saver
+keeps only the latest state of each job and retries once the lock is
+free.
+"""
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import exc as sa_exc
+
+# Least seconds between progress writes to the jobs table for one job.
+PROGRESS_SAVE_INTERVAL = 1.0
+
+# Seconds the saver waits before retrying writes the database refused.
+SAVE_RETRY_DELAY = 0.5
+
+# Most seconds JobManager.history waits for queued job states to be written.
+HISTORY_FLUSH_TIMEOUT = 5.0
+
+job_context = threading.local()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def current_job():
+    """
+    The Job running on this thread, or None.
+    """
+    return getattr(job_context, 'job', None)
+
+
+def report_total(rows):
+    """
+    Tell the current job, if any, how many rows the operation expects.
+    """
+    job = current_job()
+    if job is not None:
+        job.add_total(rows)
+
+
+def report_progress(rows):
+    """
+    Credit rows to the current job, if any, and stop with JobCancelled if
+    it has been cancelled. Called at batch boundaries.
+    """
+    job = current_job()
+    if job is not None:
+        job.add_rows(rows)
+        if job.cancel_requested.is_set():
+            raise JobCancelled(f"job {job.id} cancelled")
+
+
+class Job:
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, manager, kind, description):
+        self.manager = manager
+        self.id = None
+        self.kind = kind
+        self.description = description
+        self.state = self.PENDING
+        self.rows_done = 0
+        self.rows_total = None
+        self.created = datetime.now()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.result = None
+        self.future = None
+        self.cancel_requested = threading.Event()
+        self.last_saved = 0.0
+
+    @property
+    def finished_state(self):
+        return self.state in (self.DONE, self.FAILED, self.CANCELLED)
+
+    def fraction(self):
+        if not self.rows_total:
+            return None
+        return min(self.rows_done / self.rows_total, 1.0)
+
+    def eta(self):
+        """
+        Estimated seconds left, from the rate so far, or None.
+        """
+        if self.state != self.RUNNING or not self.rows_total or not self.rows_done:
+            return None
+        elapsed = (datetime.now() - self.started).total_seconds()
+        return max(elapsed / self.rows_done * (self.rows_total - self.rows_done), 0.0)
+
+    def add_total(self, rows):
+        self.rows_total = (self.rows_total or 0) + rows
+        self.manager.changed(self)
+
+    def add_rows(self, rows):
+        self.rows_done += rows
+        self.manager.changed(self)
+
+    def cancel(self):
+        """
+        Ask the job to stop. A pending job will not start, a running one
+        stops at its next batch boundary.
+        """
+        self.cancel_requested.set()
+        if self.future is not None and self.future.cancel():
+            self.state = self.CANCELLED
+            self.finished = datetime.now()
+            self.manager.changed(self, save=True)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job and return its result, raising its error.
+        """
+        return self.future.result(timeout)
+
+
+class JobManager:
+
+    def __init__(self, dataservice):
+        self.dataservice = dataservice
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ctrack-job")
+        self.jobs = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+        # jobs left running by a process that stopped can never finish
+        self.dataservice.fail_interrupted_jobs()
+        history = self.dataservice.get_job_history(1)
+        self.last_id = history[0].id if history else 0
+        self.unsaved = {}
+        self.saving = False
+        self.stopping = False
+        self.save_cond = threading.Condition()
+        self.saver = threading.Thread(target=self.save_loop, name="ctrack-job-save", daemon=True)
+        self.saver.start()
+
+    def subscribe(self, callback):
+        """
+        Call callback(job) whenever a job's state or progress changes. It
+        is called on the thread making the change.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def changed(self, job, save=False):
+        now = time.monotonic()
+        if save or now - job.last_saved >= PROGRESS_SAVE_INTERVAL:
+            job.last_saved = now
+            with self.save_cond:
+                self.unsaved[job.id] = job
+                self.save_cond.notify_all()
+        for callback in list(self.subscribers):
+            callback(job)
+
+    def save_loop(self):
+        """
+        Saver thread: write the jobs queued by changed, keeping any the
+        database refused, such as while an operation's transaction holds
+        the write lock, for another try.
+        """
+        while True:
+            with self.save_cond:
+                while not self.unsaved and not self.stopping:
+                    self.save_cond.wait()
+                if not self.unsaved:
+                    return
+                jobs = list(self.unsaved.values())
+                self.unsaved.clear()
+                self.saving = True
+            refused = []
+            for job in jobs:
+                try:
+                    self.dataservice.save_job(job)
+                except sa_exc.OperationalError:
+                    refused.append(job)
+            with self.save_cond:
+                for job in refused:
+                    self.unsaved.setdefault(job.id, job)
+                self.saving = False
+                self.save_cond.notify_all()
+            if refused:
+                if self.stopping:
+                    return
+                time.sleep(SAVE_RETRY_DELAY)
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued job state is written, or timeout seconds.
+        Returns True when nothing is left unsaved.
+        """
+        with self.save_cond:
+            return self.save_cond.wait_for(lambda: not self.unsaved and not self.saving, timeout)
+
+    def submit(self, kind, func, *args, description="", **kwargs):
+        """
+        Queue func(*args, **kwargs) as a job and return the Job.
+        """
+        job = Job(self, kind, description)
+        with self.lock:
+            self.last_id += 1
+            job.id = self.last_id
+            self.jobs[job.id] = job
+        self.changed(job, save=True)
+        job.future = self.executor.submit(self.run, job, func, args, kwargs)
+        return job
+
+    def run(self, job, func, args, kwargs):
+        if job.cancel_requested.is_set():
+            job.state = Job.CANCELLED
+            job.finished = datetime.now()
+            self.changed(job, save=True)
+            raise JobCancelled(f"job {job.id} cancelled")
+        job.state = Job.RUNNING
+        job.started = datetime.now()
+        self.changed(job, save=True)
+        job_context.job = job
+        try:
+            job.result = func(*args, **kwargs)
+            job.state = Job.DONE
+            return job.result
+        except JobCancelled as e:
+            job.state = Job.CANCELLED
+            job.error = str(e)
+            raise
+        except Exception as e:
+            job.state = Job.FAILED
+            job.error = str(e)
+            raise
+        finally:
+            job_context.job = None
+            job.finished = datetime.now()
+            self.changed(job, save=True)
+
+    def cancel(self, job_id):
+        self.jobs[job_id].cancel()
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def active_jobs(self):
+        return [job for job in self.jobs.values() if not job.finished_state]
+
+    def history(self, limit=50):
+        self.flush(HISTORY_FLUSH_TIMEOUT)
+        return self.dataservice.get_job_history(limit)
+
+    def shutdown(self, wait=True):
+        for job in self.active_jobs():
+            job.cancel()
+        self.executor.shutdown(wait=wait)
+        with self.save_cond:
+            self.stopping = True
+            self.save_cond.notify_all()
+        if wait:
+            self.saver.join()
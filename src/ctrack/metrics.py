@@ -0,0 +1,198 @@
+"""
+Opt-in timing instrumentation for DataService and MainFlow.
+
+Nothing is recorded until metrics.enable() is called (or CTRACK_METRICS is
+set in the environment). Once enabled every public method of an
+@instrumented class records its call count, a latency histogram, the SQL
+statements executed on watched engines while it ran and the rows it
+reported through metrics.add_rows. Counts for nested calls are included
+in the outer call's counts as well as their own.
+"""
+import os
+import time
+import math
+import inspect
+import threading
+import functools
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+
+@dataclass
+class OpStats:
+    name: str
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    sql_statements: int = 0
+    rows: int = 0
+    # one count per LATENCY_BUCKETS entry, not cumulative
+    buckets: list = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+    def quantile(self, q):
+        """
+        Upper bound of the histogram bucket holding the q quantile.
+        """
+        target = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+
+class Metrics:
+
+    def __init__(self):
+        self.enabled = bool(os.environ.get("CTRACK_METRICS"))
+        self.ops = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.ops = {}
+
+    def active_calls(self):
+        calls = getattr(self.local, 'calls', None)
+        if calls is None:
+            calls = self.local.calls = []
+        return calls
+
+    def add_rows(self, count):
+        """
+        Credit count processed rows to every instrumented call running
+        on this thread.
+        """
+        if self.enabled:
+            for call in self.active_calls():
+                call['rows'] += count
+
+    def count_statement(self, *args):
+        if self.enabled:
+            for call in self.active_calls():
+                call['sql'] += 1
+
+    def watch_engine(self, engine):
+        """
+        Count the SQL statements run on engine against the active calls.
+        """
+        event.listen(engine, "before_cursor_execute", self.count_statement)
+
+    def record(self, name, seconds, sql=0, rows=0, error=False):
+        with self.lock:
+            stats = self.ops.get(name)
+            if stats is None:
+                stats = self.ops[name] = OpStats(name)
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.sql_statements += sql
+            stats.rows += rows
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[index] += 1
+                    break
+
+    def snapshot(self):
+        """
+        Copies of the recorded OpStats, sorted by total time, longest first.
+        """
+        with self.lock:
+            ops = [OpStats(s.name, s.calls, s.errors, s.total_seconds, s.max_seconds,
+                           s.sql_statements, s.rows, list(s.buckets))
+                   for s in self.ops.values()]
+        return sorted(ops, key=lambda s: s.total_seconds, reverse=True)
+
+    def timed(self, name, func):
+        """
+        Wrap func so each call is recorded under name while enabled.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            calls = self.active_calls()
+            call = dict(sql=0, rows=0)
+            calls.append(call)
+            error = True
+            start = time.perf_counter()
+            try:
+                res = func(*args, **kwargs)
+                error = False
+                return res
+            finally:
+                seconds = time.perf_counter() - start
+                calls.pop()
+                self.record(name, seconds, call['sql'], call['rows'], error)
+        return wrapper
+
+    def render_text(self):
+        """
+        The recorded metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        ops = sorted(self.snapshot(), key=lambda s: s.name)
+        for metric, kind, help_text in (
+                ("ctrack_calls_total", "counter", "Calls per operation"),
+                ("ctrack_errors_total", "counter", "Calls that raised per operation"),
+                ("ctrack_sql_statements_total", "counter", "SQL statements run per operation"),
+                ("ctrack_rows_total", "counter", "Rows processed per operation"),
+                ("ctrack_call_seconds", "histogram", "Call latency per operation")):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for stats in ops:
+                label = f'op="{stats.name}"'
+                if metric == "ctrack_calls_total":
+                    lines.append(f"{metric}{{{label}}} {stats.calls}")
+                elif metric == "ctrack_errors_total":
+                    lines.append(f"{metric}{{{label}}} {stats.errors}")
+                elif metric == "ctrack_sql_statements_total":
+                    lines.append(f"{metric}{{{label}}} {stats.sql_statements}")
+                elif metric == "ctrack_rows_total":
+                    lines.append(f"{metric}{{{label}}} {stats.rows}")
+                else:
+                    seen = 0
+                    for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                        seen += count
+                        le = "+Inf" if bound == math.inf else f"{bound}"
+                        lines.append(f'{metric}_bucket{{{label},le="{le}"}} {seen}')
+                    lines.append(f"{metric}_sum{{{label}}} {stats.total_seconds:.6f}")
+                    lines.append(f"{metric}_count{{{label}}} {stats.calls}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrumented(cls):
+    """
+    Class decorator that times every public method defined on the class,
+    recording it as ClassName.method. Generator methods are left alone
+    since their work happens after the call returns.
+    """
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith('_') or not inspect.isfunction(value):
+            continue
+        if inspect.isgeneratorfunction(inspect.unwrap(value)):
+            continue
+        setattr(cls, attr, metrics.timed(f"{cls.__name__}.{attr}", value))
+    return cls
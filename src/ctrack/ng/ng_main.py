@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+from contextlib import asynccontextmanager
 import re
+import asyncio
 from pathlib import Path
 import json
 from typing import Optional, Any
@@ -7,6 +9,50 @@ from nicegui import events, ui
 from nicegui.element import Element
 from ctrack.flow import MainFlow
 from ctrack.data_service import MatcherRule, Account
+from ctrack.metrics import metrics
+from ctrack.async_service import AsyncRunner, AsyncMainFlow
+from ctrack.jobs import JobManager
+
+
+@asynccontextmanager
+async def busy(message):
+    """
+    Show a spinner notification while the block awaits a long operation.
+    """
+    note = ui.notification(message, spinner=True, timeout=None)
+    try:
+        yield note
+    finally:
+        note.dismiss()
+
+
+def describe_progress(job):
+    text = f'{job.rows_done} rows'
+    fraction = job.fraction()
+    if fraction is not None:
+        text += f' ({fraction:.0%})'
+    eta = job.eta()
+    if eta is not None:
+        text += f', about {eta:.0f}s left'
+    return text
+
+
+async def run_job(ui_app, kind, func, *args, description=""):
+    """
+    Run func as a background job, holding the UI write lock so no other
+    write starts meanwhile, and show its progress until it finishes.
+    Returns the job's result.
+    """
+    async with ui_app.runner.write_lock:
+        job = ui_app.jobs.submit(kind, func, *args, description=description)
+        note = ui.notification(description, spinner=True, timeout=None)
+        timer = ui.timer(0.5, lambda: setattr(note, 'message',
+                                              f'{description}: {describe_progress(job)}'))
+        try:
+            return await asyncio.wrap_future(job.future)
+        finally:
+            timer.cancel()
+            note.dismiss()
 
 @dataclass
 class MainLayout:
@@ -82,13 +128,13 @@ class GnuCashPage(MainPanelContent):
 
     def __init__(self, main_window):
         super().__init__(self.page_name, main_window)
-        self.dataservice = self.main_window.ui_app.dataservice
+        self.dataservice = self.main_window.ui_app.async_dataservice
 
     async def select_file_content(self):
         self.main_panel.clear()
         with self.main_panel:
             with ui.grid(columns='auto auto 4fr'):
-                gcpicker = GnuCashPicker(self.main_window.ui_app.dataservice, self.show)
+                gcpicker = GnuCashPicker(self.dataservice, self.show)
                 ui.label('Gnucash').classes('py-2 px-2 ')
                 ui.button('Choose File', on_click=gcpicker.pick_file, icon='folder')
         
@@ -107,7 +153,7 @@ class StatusPage(MainPanelContent):
     page_name = "Status"
     def __init__(self, main_window):
         super().__init__(self.page_name, main_window)
-        self.dataservice = self.main_window.ui_app.dataservice
+        self.dataservice = self.main_window.ui_app.async_dataservice
         
     async def show(self):
         self.main_panel.clear()
@@ -126,13 +172,15 @@ class TFilesPage(MainPanelContent):
     
     def __init__(self, main_window):
         super().__init__(self.page_name, main_window)
-        self.dataservice = self.main_window.ui_app.dataservice
+        self.dataservice = self.main_window.ui_app.async_dataservice
         self.file_pages = {}
         
     async def show(self):
+        unsaved = await self.dataservice.get_transaction_files(unsaved_only=True)
+        saved = await self.dataservice.get_transaction_files(saved_only=True)
         self.main_panel.clear()
         with self.main_panel:
-            tfpicker = TransactionFilePicker(self.main_window.ui_app.dataservice, self.show)
+            tfpicker = TransactionFilePicker(self.main_window.ui_app, self.show)
             ui.button("Add file", on_click=tfpicker.pick_file,
                       icon='folder').classes('py-2 px-2 ')
 
@@ -140,13 +188,13 @@ class TFilesPage(MainPanelContent):
                 ui.label('Status').classes('py-2 px-2 ')
                 ui.label('Action').classes('py-2 px-2 ')
                 ui.label('Path').classes('py-2 px-2 ')
-                for workfile in self.dataservice.get_transaction_files(unsaved_only=True):
+                for workfile in unsaved:
                     ui.label('Not saved').classes('py-2 px-2 ')
                     ui.button('Edit',
                               on_click=lambda workfile=workfile:self.edit_file(workfile)
                               ).classes('py-2 px-2 ')
                     ui.label(workfile.import_source_file).classes('py-2 px-2 ')
-                for savedfile in self.dataservice.get_transaction_files(saved_only=True):
+                for savedfile in saved:
                     ui.label('Saved').classes('py-2 px-2 ')
                     ui.label('View').classes('py-2 px-2 ')
                     ui.label(savedfile.import_source_file).classes('py-2 px-2 ')
@@ -165,12 +213,13 @@ class MatchersPage(MainPanelContent):
     
     def __init__(self, main_window):
         super().__init__(self.page_name, main_window)
-        self.dataservice = self.main_window.ui_app.dataservice
+        self.dataservice = self.main_window.ui_app.async_dataservice
         
     async def show(self):
+        matchers = await self.dataservice.get_matchers()
         self.main_panel.clear()
         with self.main_panel:
-            mfpicker = MatcherFilePicker(self.main_window.ui_app.dataservice, self.show)
+            mfpicker = MatcherFilePicker(self.main_window.ui_app, self.show)
             ui.button("Add from file", on_click=mfpicker.pick_file,
                       icon='folder').classes('py-2 px-2 ')
 
@@ -178,7 +227,7 @@ class MatchersPage(MainPanelContent):
                 ui.label('Regexp').classes('border py-2 px-2 ')
                 ui.label('NoCase').classes('border py-2 px-2 ')
                 ui.label('Account Path').classes('border py-2 px-2')
-                for matcher in self.dataservice.get_matchers():
+                for matcher in matchers:
                     ui.label(matcher.regexp).classes('border py-1 px-2')
                     ui.label(str(matcher.no_case)).classes('border py-1 px-2')
                     ui.label(matcher.account_name).classes('border py-1 px-2')
@@ -186,79 +235,206 @@ class MatchersPage(MainPanelContent):
 
 class TFilePage(MainPanelContent):
 
-    
+    rows_per_page = 100
+    filter_options = {'all': 'All rows', 'matched': 'Matched', 'unmatched': 'Unmatched'}
+    filter_values = {'all': None, 'matched': True, 'unmatched': False}
+    sort_options = {'row': 'File order', 'date': 'Date', 'description': 'Description',
+                    'amount': 'Amount'}
+
     def __init__(self, main_window, tfile_rec):
         self.tfile_rec = tfile_rec
         page_name = tfile_rec.display_name
         super().__init__(page_name, main_window)
-        self.dataservice = self.main_window.ui_app.dataservice
-        
-    async def show(self):
-        self.main_panel.clear()
-        with self.main_panel:
-            with ui.grid(columns='auto auto 1fr').classes('w-full gap-0'):
-                ui.label('Regexp').classes('border py-2 px-2 ')
-                ui.label('NoCase').classes('border py-2 px-2 ')
-                ui.label('Account Path').classes('border py-2 px-2')
+        self.dataservice = self.main_window.ui_app.async_dataservice
+        self.offset = 0
+        self.row_filter = 'all'
+        self.sort_by = 'row'
+        self.descending = False
+        self.grid = None
+        self.page_label = None
 
-                ui.label('')
-                ui.label(self.tfile_rec.display_name)
-                ui.label(self.tfile_rec.import_source_file)
-                    
     async def show(self):
+        runner = self.main_window.ui_app.runner
+        column_map = await runner.read(self.tfile_rec.get_column_map)
+        raw_data = await runner.read(self.tfile_rec.get_raw_data)
         self.main_panel.clear()
         with self.main_panel:
             ui.label(f'File path = {self.tfile_rec.import_source_file}')
-            column_map = self.tfile_rec.get_column_map()
             if column_map is None:
                 ui.label("No column map matches this file").classes('text-lg text-bold')
-            raw_data = self.tfile_rec.get_raw_data()
-            col_names = json.loads(raw_data.col_names_json)
-            header = []
+            col_names = raw_data.get_col_names()
+            marks = {}
             if column_map:
-                header = ["auto"] # for "matched" column
-                xactions = self.dataservice.get_transactions(self.tfile_rec)
-            else:
-                xactions = None
-            for fname in col_names: 
-                header.append("auto")
-            cstring = " ".join(header)
-            unmatched = []
-            with ui.grid(columns=cstring).classes('w-full gap-0'):
-                if column_map:
-                    ui.label("Matched").classes('border py-2 px-2 ')
-                    for cname in col_names:
-                        if cname == column_map.date_column:
-                            ui.label("* DATE *").classes('border py-2 px-2 ')
-                        elif cname == column_map.description_column:
-                            ui.label("* DESCRIPTION *").classes('border py-2 px-2 ')
-                        elif cname == column_map.amount_column:
-                            ui.label("* AMOUNT *").classes('border py-2 px-2 ')
-                        else:
-                            ui.label("").classes('border py-2 px-2 ')
-                if column_map:
-                    ui.label('').classes('border py-2 px-2 ')
-                for cname in col_names:
-                    ui.label(cname).classes('border py-2 px-2 ')
-                    
-                for index,row in enumerate(json.loads(raw_data.rows_json)):
-                    if column_map:
-                        xact = xactions[index]
-                        if xact.matcher_id:
-                            ui.label('True').classes('border py-2 px-2 ')
-                        else:
-                            ui.label('False').classes('border py-2 px-2 ')
-                    for col in col_names:
-                        ui.label(row[col]).classes('border px-2 ')
-
-
-default_main_content_items = [StatusPage, GnuCashPage, TFilesPage, MatchersPage]
+                marks = {column_map.date_column: "DATE",
+                         column_map.description_column: "DESCRIPTION",
+                         column_map.amount_column: "AMOUNT"}
+                with ui.row().classes('items-center'):
+                    ui.select(self.filter_options, value=self.row_filter,
+                              on_change=lambda e: self.set_view(row_filter=e.value))
+                    ui.select(self.sort_options, value=self.sort_by,
+                              on_change=lambda e: self.set_view(sort_by=e.value))
+                    ui.checkbox('Descending', value=self.descending,
+                                on_change=lambda e: self.set_view(descending=e.value))
+            # CSV column names can hold characters AG Grid treats specially
+            # in field names, so columns are addressed by position.
+            column_defs = []
+            if column_map:
+                column_defs.append({'field': 'matched', 'headerName': 'Matched'})
+            for index, cname in enumerate(col_names):
+                header = f"{cname} * {marks[cname]} *" if cname in marks else cname
+                column_defs.append({'field': f'c{index}', 'headerName': header})
+            self.col_names = col_names
+            self.grid = ui.aggrid({
+                'columnDefs': column_defs,
+                'defaultColDef': {'sortable': False},
+                'rowData': [],
+            }).classes('w-full h-[70vh]')
+            with ui.row().classes('items-center'):
+                ui.button(icon='chevron_left', on_click=lambda: self.move(-1))
+                self.page_label = ui.label('')
+                ui.button(icon='chevron_right', on_click=lambda: self.move(1))
+        await self.load_page()
+
+    async def set_view(self, **kwargs):
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        self.offset = 0
+        await self.load_page()
+
+    async def move(self, pages):
+        offset = self.offset + pages * self.rows_per_page
+        if offset < 0 or offset >= self.total:
+            return
+        self.offset = offset
+        await self.load_page()
+
+    async def load_page(self):
+        self.total, rows = await self.dataservice.get_transaction_page(
+            self.tfile_rec, self.offset, self.rows_per_page,
+            matched=self.filter_values[self.row_filter],
+            sort_by=self.sort_by, descending=self.descending)
+        row_data = []
+        for number, matched, raw_row in rows:
+            item = {f'c{index}': raw_row.get(cname) for index, cname in enumerate(self.col_names)}
+            item['matched'] = str(matched) if matched is not None else ''
+            row_data.append(item)
+        self.grid.options['rowData'] = row_data
+        self.grid.update()
+        last = min(self.offset + self.rows_per_page, self.total)
+        self.page_label.set_text(f'Rows {self.offset + 1 if self.total else 0} - {last} of {self.total}')
+
+
+class PerformancePage(MainPanelContent):
+
+    page_name = "Performance"
+    columns = [
+        {'name': 'op', 'label': 'Operation', 'field': 'op', 'align': 'left', 'sortable': True},
+        {'name': 'calls', 'label': 'Calls', 'field': 'calls', 'sortable': True},
+        {'name': 'errors', 'label': 'Errors', 'field': 'errors', 'sortable': True},
+        {'name': 'total', 'label': 'Total s', 'field': 'total', 'sortable': True},
+        {'name': 'mean', 'label': 'Mean ms', 'field': 'mean', 'sortable': True},
+        {'name': 'p95', 'label': 'p95 ms', 'field': 'p95', 'sortable': True},
+        {'name': 'max', 'label': 'Max ms', 'field': 'max', 'sortable': True},
+        {'name': 'sql', 'label': 'SQL', 'field': 'sql', 'sortable': True},
+        {'name': 'rows', 'label': 'Rows', 'field': 'rows', 'sortable': True},
+    ]
+
+    def __init__(self, main_window):
+        super().__init__(self.page_name, main_window)
+
+    async def reset(self):
+        metrics.reset()
+        await self.show()
+
+    async def show(self):
+        self.main_panel.clear()
+        with self.main_panel:
+            if not metrics.enabled:
+                ui.label('Metrics are not being recorded, start with --metrics to turn them on')
+                return
+            with ui.row():
+                ui.button('Refresh', on_click=self.show, icon='refresh')
+                ui.button('Reset', on_click=self.reset)
+            rows = []
+            for stats in metrics.snapshot():
+                rows.append({'op': stats.name,
+                             'calls': stats.calls,
+                             'errors': stats.errors,
+                             'total': round(stats.total_seconds, 3),
+                             'mean': round(stats.mean_seconds * 1000, 2),
+                             'p95': round(stats.quantile(0.95) * 1000, 2),
+                             'max': round(stats.max_seconds * 1000, 2),
+                             'sql': stats.sql_statements,
+                             'rows': stats.rows})
+            ui.table(columns=self.columns, rows=rows, row_key='op').classes('w-full')
+
+
+class JobsPage(MainPanelContent):
+
+    page_name = "Jobs"
+
+    def __init__(self, main_window):
+        super().__init__(self.page_name, main_window)
+        self.jobs = self.main_window.ui_app.jobs
+        self.active_panel = None
+        self.changed = True
+        # called on the job thread, so only flag the change for the timer
+        self.jobs.subscribe(self.job_changed)
+
+    def job_changed(self, job):
+        self.changed = True
+
+    async def show(self):
+        self.main_panel.clear()
+        with self.main_panel:
+            ui.label('Running and queued').classes('text-lg text-bold')
+            self.active_panel = ui.column().classes('w-full')
+            ui.label('History').classes('text-lg text-bold')
+            history = await self.main_window.ui_app.runner.read(self.jobs.history)
+            with ui.grid(columns='auto auto auto auto 1fr').classes('w-full gap-0'):
+                for title in ('Job', 'State', 'Rows', 'Finished', 'Error'):
+                    ui.label(title).classes('border py-2 px-2')
+                for rec in history:
+                    ui.label(rec.description or rec.kind).classes('border py-1 px-2')
+                    ui.label(rec.state).classes('border py-1 px-2')
+                    ui.label(str(rec.rows_done)).classes('border py-1 px-2')
+                    ui.label(str(rec.finished or '')).classes('border py-1 px-2')
+                    ui.label(rec.error or '').classes('border py-1 px-2')
+            ui.timer(0.5, self.update_active)
+        self.changed = True
+        self.update_active()
+
+    def update_active(self):
+        if not self.changed:
+            return
+        self.changed = False
+        self.active_panel.clear()
+        with self.active_panel:
+            active = self.jobs.active_jobs()
+            if not active:
+                ui.label('No jobs running')
+            for job in active:
+                with ui.row().classes('items-center w-full'):
+                    ui.label(job.description or job.kind)
+                    ui.label(job.state)
+                    ui.linear_progress(value=job.fraction() or 0, show_value=False).classes('w-64')
+                    ui.label(describe_progress(job))
+                    ui.button('Cancel', on_click=lambda job=job: job.cancel()).props('outline')
+
+
+default_main_content_items = [StatusPage, GnuCashPage, TFilesPage, MatchersPage, JobsPage,
+                              PerformancePage]
                     
 class UIApp:
 
     def __init__(self, data_dir, gnucash_path=None):
         self.main_flow = MainFlow(data_dir, gnucash_path)
         self.dataservice = self.main_flow.dataservice
+        # handlers go through these so database and book work runs off the event loop
+        self.runner = AsyncRunner()
+        self.async_flow = AsyncMainFlow(self.main_flow, self.runner)
+        self.async_dataservice = self.async_flow.dataservice
+        self.jobs = JobManager(self.dataservice)
         self.main_window = MainWindow(self)
 
     async def start(self):
@@ -380,14 +556,15 @@ class GnuCashPicker:
     async def pick_file(self) -> None:
         result = await local_file_picker(self.spath, upper_limit = self.ulimit, multiple=False)
         if result:
-            self.dataservice.load_gnucash_file(result[0])
+            async with busy('Loading GnuCash accounts'):
+                await self.dataservice.set_gnucash_file(result[0])
             if self.done_callback:
                 await self.done_callback()
             
 class TransactionFilePicker:
 
-    def __init__(self, dataservice, done_callback=None):
-        self.dataservice = dataservice
+    def __init__(self, ui_app, done_callback=None):
+        self.ui_app = ui_app
         self.done_callback = done_callback
         self.spath = "."
         self.ulimit = Path("~").expanduser()
@@ -396,15 +573,16 @@ class TransactionFilePicker:
         result = await local_file_picker(self.spath, upper_limit = self.ulimit,
                                          multiple=False)
         if result:
-            self.dataservice.load_transactions(result[0])
+            await run_job(self.ui_app, "load_transactions", self.ui_app.dataservice.load_transactions,
+                          result[0], description=f'Importing {Path(result[0]).name}')
             if self.done_callback:
                 await self.done_callback()
             
 
 class MatcherFilePicker:
 
-    def __init__(self, dataservice, done_callback=None):
-        self.dataservice = dataservice
+    def __init__(self, ui_app, done_callback=None):
+        self.ui_app = ui_app
         self.done_callback = done_callback
         self.spath = "."
         self.ulimit = Path("~").expanduser()
@@ -413,7 +591,9 @@ class MatcherFilePicker:
         result = await local_file_picker(self.spath, upper_limit = self.ulimit,
                                          multiple=False)
         if result:
-            self.dataservice.load_matcher_file(result[0])
+            await run_job(self.ui_app, "load_matcher_rules_file",
+                          self.ui_app.main_flow.load_matcher_rules_file, result[0],
+                          description=f'Loading matcher rules from {Path(result[0]).name}')
             if self.done_callback:
                 await self.done_callback()
             
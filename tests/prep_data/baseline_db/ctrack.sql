@@ -0,0 +1,83 @@
+BEGIN TRANSACTION;
+CREATE TABLE accounts (
+	id INTEGER NOT NULL, 
+	name VARCHAR, 
+	description VARCHAR, 
+	in_gnucash BOOLEAN, 
+	balance INTEGER, 
+	PRIMARY KEY (id)
+);
+INSERT INTO "accounts" VALUES(1,'Expenses:House:Insurance','House Insurance',1,0);
+CREATE TABLE cc_raw_transactions (
+	id INTEGER NOT NULL, 
+	col_names_json VARCHAR, 
+	rows_json VARCHAR, 
+	file_id INTEGER, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(file_id) REFERENCES cc_transaction_files (id) ON DELETE CASCADE
+);
+INSERT INTO "cc_raw_transactions" VALUES(1,'["Posted Date", "Reference Number", "Payee", "Address", "Amount"]','[{"Posted Date": "08/02/2025", "Reference Number": "24231685213428111537747", "Payee": "HEB ONLINE #108 855-803-0611 TX", "Address": "855-803-0611  TX ", "Amount": "-151.84"}, {"Posted Date": "08/02/2025", "Reference Number": "24692165213100029097388", "Payee": "Kindle Unltd*12345678 888-802-3080 WA", "Address": "888-802-3080  WA ", "Amount": "-12.98"}, {"Posted Date": "07/29/2025", "Reference Number": "2.100130536E+022", "Payee": "PMT FROM BILL PAYER SERVICE", "Address": "", "Amount": "164.82"}]',1);
+INSERT INTO "cc_raw_transactions" VALUES(2,'["Date", "Reference Number", "Payee", "Address", "Amount"]','[{"Date": "08/02/2025", "Reference Number": "24692165213100029097388", "Payee": "Kindle Unltd*12345678 888-802-3080 WA", "Address": "888-802-3080  WA ", "Amount": "-12.98"}]',2);
+CREATE TABLE cc_transaction_files (
+	id INTEGER NOT NULL, 
+	external_id VARCHAR, 
+	import_source_file VARCHAR, 
+	column_map_id INTEGER, 
+	saved_to_gnucash BOOLEAN, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(column_map_id) REFERENCES column_maps (id) ON DELETE SET NULL
+);
+INSERT INTO "cc_transaction_files" VALUES(1,'MC1','DATA_DIR/cc_with_payment.csv',1,0);
+INSERT INTO "cc_transaction_files" VALUES(2,'MC1','DATA_DIR/cc_no_col_map.csv',NULL,0);
+CREATE TABLE cc_transactions (
+	id INTEGER NOT NULL, 
+	date DATE, 
+	description VARCHAR, 
+	amount INTEGER, 
+	is_payment BOOLEAN, 
+	file_id INTEGER, 
+	matcher_id INTEGER, 
+	raw_row_number INTEGER, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(file_id) REFERENCES cc_transaction_files (id) ON DELETE CASCADE, 
+	FOREIGN KEY(matcher_id) REFERENCES matcher_rules (id) ON DELETE SET NULL
+);
+INSERT INTO "cc_transactions" VALUES(1,'2025-08-02','HEB ONLINE #108 855-803-0611 TX',-15184,0,1,8,0);
+INSERT INTO "cc_transactions" VALUES(2,'2025-08-02','Kindle Unltd*12345678 888-802-3080 WA',-1298,0,1,NULL,1);
+INSERT INTO "cc_transactions" VALUES(3,'2025-07-29','PMT FROM BILL PAYER SERVICE',16482,1,1,NULL,2);
+CREATE TABLE column_maps (
+	id INTEGER NOT NULL, 
+	map_name VARCHAR, 
+	date_column VARCHAR, 
+	description_column VARCHAR, 
+	amount_column VARCHAR, 
+	date_format VARCHAR, 
+	negative_amounts BOOLEAN, 
+	PRIMARY KEY (id)
+);
+INSERT INTO "column_maps" VALUES(1,'boa','Posted Date','Payee','Amount','%m/%d/%Y',1);
+CREATE TABLE matcher_rules (
+	id INTEGER NOT NULL, 
+	regexp VARCHAR, 
+	no_case BOOLEAN, 
+	account_name VARCHAR, 
+	PRIMARY KEY (id)
+);
+INSERT INTO "matcher_rules" VALUES(1,'^amazon\.com',1,'Expenses:online_shop:Amazon');
+INSERT INTO "matcher_rules" VALUES(2,'^amazon mktp',1,'Expenses:online_shop:Amazon');
+INSERT INTO "matcher_rules" VALUES(3,'^amzn mktp',1,'Expenses:online_shop:Amazon');
+INSERT INTO "matcher_rules" VALUES(4,'^amzn prime',1,'Expenses:online_shop:Amazon');
+INSERT INTO "matcher_rules" VALUES(5,'^amazon prime',1,'Expenses:online_shop:Amazon');
+INSERT INTO "matcher_rules" VALUES(6,'^prime video',1,'Expenses:online_service:entertainment:Streaming');
+INSERT INTO "matcher_rules" VALUES(7,'^netflix',1,'Expenses:online_service:entertainment:Streaming');
+INSERT INTO "matcher_rules" VALUES(8,'^heb online',1,'Expenses:groceries:heb:online_groceries');
+CREATE TABLE meta_data (
+	id INTEGER NOT NULL, 
+	gnucash_file VARCHAR, 
+	PRIMARY KEY (id)
+);
+INSERT INTO "meta_data" VALUES(1,'DATA_DIR/test.gnucash');
+CREATE UNIQUE INDEX ix_column_maps_map_name ON column_maps (map_name);
+CREATE UNIQUE INDEX ix_accounts_name ON accounts (name);
+CREATE UNIQUE INDEX ix_matcher_rules_regexp ON matcher_rules (regexp);
+COMMIT;
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+from pathlib import Path
+import asyncio
+import shutil
+import threading
+import time
+import pytest
+
+from ctrack.async_service import AsyncRunner, AsyncFacade, AsyncMainFlow
+from ctrack.flow import MainFlow, NextStep
+
+
+class Recorder:
+
+    def __init__(self):
+        self.active = 0
+        self.most_active = 0
+        self.threads = set()
+        self.lock = threading.Lock()
+        self.name = "recorder"
+
+    def work(self, value):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+            self.threads.add(threading.get_ident())
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return value
+
+    def write(self, value):
+        return self.work(value)
+
+    def read(self, value):
+        return self.work(value)
+
+
+class RecorderFacade(AsyncFacade):
+
+    write_methods = frozenset({"write"})
+
+
+def test_async_facade():
+
+    async def run():
+        runner = AsyncRunner(max_workers=4)
+        writes = Recorder()
+        reads = Recorder()
+        try:
+            facade = RecorderFacade(writes, runner)
+            assert facade.name == "recorder"
+            assert await asyncio.gather(*[facade.write(i) for i in range(4)]) == [0, 1, 2, 3]
+            facade = RecorderFacade(reads, runner)
+            assert await asyncio.gather(*[facade.read(i) for i in range(4)]) == [0, 1, 2, 3]
+        finally:
+            runner.shutdown()
+        return writes, reads
+
+    writes, reads = asyncio.run(run())
+    # writes one at a time, reads side by side, none on the event loop thread
+    assert writes.most_active == 1
+    assert reads.most_active > 1
+    assert threading.get_ident() not in writes.threads | reads.threads
+
+
+def test_async_main_flow():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+
+    async def run():
+        runner = AsyncRunner()
+        try:
+            flow = AsyncMainFlow(MainFlow(data_dir, data_dir / "test.gnucash"), runner)
+            await asyncio.gather(flow.add_xaction_file(data_dir / "cc_with_payment.csv"),
+                                 flow.load_matcher_rules_file(data_dir / "matcher_map.csv"))
+            files = await flow.dataservice.get_transaction_files(unsaved_only=True)
+            assert len(files) == 1
+            with pytest.raises(Exception):
+                await flow.dataservice.report_totals("week")
+            return await flow.get_next_step()
+        finally:
+            runner.shutdown()
+
+    assert asyncio.run(run()) == NextStep.ADD_MATCHER_RULE
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+from pathlib import Path
+import csv
+import shutil
+import pytest
+
+from ctrack import data_service
+from ctrack.data_service import DataService
+
+
+def test_bulk_load_matches_orm_load():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    dataservice = DataService(data_dir)
+    dataservice.load_matcher_file(data_dir / "matcher_map.csv")
+
+    def fields(file_rec):
+        return [(x.date, x.description, x.amount, x.is_payment, x.matcher_id, x.raw_row_number)
+                for x in dataservice.get_transactions(file_rec)]
+
+    orm_file = dataservice.load_transactions(data_dir / "cc_with_payment.csv")
+    orm_rows = fields(orm_file)
+    # batch size smaller than the file, so more than one batch is written
+    bulk_file = dataservice.reload_transactions(data_dir / "cc_with_payment.csv",
+                                                bulk=True, batch_size=2)
+    assert len(orm_rows) == 3
+    assert fields(bulk_file) == orm_rows
+
+    # the raw cents read path agrees with the Decimal one
+    rows = dataservice.get_transactions_with_accounts(bulk_file)
+    assert [data_service.cents_to_decimal(r.amount_cents) for r in rows] == [r[2] for r in orm_rows]
+    assert all(isinstance(r.amount_cents, int) for r in rows)
+
+
+def test_streaming_import(monkeypatch):
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    # two rows per page, so the three row file spans two pages
+    monkeypatch.setattr(data_service, "RAW_PAGE_SIZE", 2)
+    dataservice = DataService(data_dir)
+    dataservice.load_matcher_file(data_dir / "matcher_map.csv")
+
+    csv_path = data_dir / "cc_with_payment.csv"
+    with open(csv_path) as f:
+        expected = list(csv.DictReader(f))
+    file_rec = dataservice.load_transactions(csv_path)
+    assert list(dataservice.iter_raw_rows(file_rec)) == expected
+    # rows can be read by number without decoding the whole file
+    assert dataservice.get_raw_rows(file_rec, 1, 2) == expected[1:3]
+    assert dataservice.get_raw_rows(file_rec, 2) == expected[2:]
+    assert dataservice.get_raw_row(file_rec, 0) == expected[0]
+    assert dataservice.get_raw_row(file_rec, 3) is None
+    xacts = dataservice.get_transactions(file_rec)
+    assert [x.raw_row_number for x in xacts] == [0, 1, 2]
+    for xact in xacts:
+        assert dataservice.get_raw_row(file_rec, xact.raw_row_number)['Payee'] == xact.description
+    assert [x.description for x in xacts] == [row['Payee'] for row in expected]
+
+    # a forced re-import replaces everything from the earlier one
+    file_rec = dataservice.reload_transactions(csv_path, bulk=True)
+    assert list(dataservice.iter_raw_rows(file_rec)) == expected
+    session = dataservice.Session()
+    try:
+        assert session.query(data_service.CCTransaction).count() == 3
+        assert session.query(data_service.CCRawRowsPage).count() == 2
+        assert session.query(data_service.CCTransactionsRaw).count() == 1
+    finally:
+        session.close()
+
+
+def test_transaction_page(monkeypatch):
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    monkeypatch.setattr(data_service, "RAW_PAGE_SIZE", 2)
+    dataservice = DataService(data_dir)
+    dataservice.load_matcher_file(data_dir / "matcher_map.csv")
+
+    pay_file = dataservice.load_transactions(data_dir / "cc_with_payment.csv")
+    # heb row matched, kindle and payment rows not
+    total, rows = dataservice.get_transaction_page(pay_file)
+    assert total == 3
+    assert [(number, matched) for number, matched, raw in rows] == [(0, True), (1, False), (2, False)]
+    assert rows[2][2]['Payee'] == "PMT FROM BILL PAYER SERVICE"
+
+    total, rows = dataservice.get_transaction_page(pay_file, matched=False)
+    assert total == 2
+    assert [number for number, matched, raw in rows] == [1, 2]
+
+    total, rows = dataservice.get_transaction_page(pay_file, sort_by="amount", descending=True)
+    assert [raw['Amount'] for number, matched, raw in rows] == ["164.82", "-12.98", "-151.84"]
+
+    total, rows = dataservice.get_transaction_page(pay_file, offset=1, limit=1, sort_by="amount")
+    assert total == 3
+    assert [number for number, matched, raw in rows] == [1]
+
+    no_map_file = dataservice.load_transactions(data_dir / "cc_no_col_map.csv")
+    total, rows = dataservice.get_transaction_page(no_map_file, matched=True, sort_by="amount")
+    assert total == 1
+    assert rows[0][0] == 0 and rows[0][1] is None
+
+
+def test_duplicate_import():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    dataservice = DataService(data_dir)
+
+    csv_path = data_dir / "cc_with_payment.csv"
+    first = dataservice.load_transactions(csv_path)
+    xact_ids = [x.id for x in dataservice.get_transactions(first)]
+    assert first.content_hash is not None
+
+    # unchanged file is left alone
+    again = dataservice.load_transactions(csv_path)
+    assert again.id == first.id
+    assert [x.id for x in dataservice.get_transactions(again)] == xact_ids
+
+    # same statement downloaded under another name is recognized
+    copy_path = data_dir / "cc_with_payment_copy.csv"
+    shutil.copy(csv_path, copy_path)
+    copy = dataservice.load_transactions(copy_path)
+    assert copy.id == first.id
+    assert len(dataservice.get_transaction_files()) == 1
+
+    # changed contents are imported again
+    with open(csv_path, "a") as f:
+        f.write('08/03/2025,1,"HEB ONLINE #108 855-803-0611 TX","",-1.00\n')
+    changed = dataservice.load_transactions(csv_path)
+    assert changed.content_hash != first.content_hash
+    assert len(dataservice.get_transactions(changed)) == 4
+    assert len(dataservice.get_transaction_files()) == 1
+
+
+def test_import_directory():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    dataservice = DataService(data_dir)
+    dataservice.load_matcher_file(data_dir / "matcher_map.csv")
+    shutil.copy(data_dir / "cc_with_payment.csv", data_dir / "cc_with_payment_copy.csv")
+    with open(data_dir / "cc_bad_date.csv", "w") as f:
+        f.write("Posted Date,Reference Number,Payee,Address,Amount\n")
+        f.write('2025-08-02,1,"HEB ONLINE #108","",-1.00\n')
+
+    results = dataservice.import_directory(data_dir, pattern="cc_*.csv", workers=2)
+    by_name = {result.path.name: result for result in results}
+    assert sorted(by_name) == ["cc_bad_date.csv", "cc_no_col_map.csv", "cc_one_match_one_miss.csv",
+                               "cc_with_payment.csv", "cc_with_payment_copy.csv"]
+    assert isinstance(by_name["cc_bad_date.csv"].error, ValueError)
+    assert by_name["cc_bad_date.csv"].file_rec is None
+    assert not by_name["cc_no_col_map.csv"].file_rec.columns_mapped
+    # the copy is recognized as the same statement
+    assert by_name["cc_with_payment_copy.csv"].file_rec.id == by_name["cc_with_payment.csv"].file_rec.id
+    assert len(dataservice.get_transaction_files()) == 3
+    # workers hand pages over through spool files, removed once stored
+    assert list(data_dir.glob("*.spool")) == []
+
+    # stored the same way a single file import would
+    pay_file = by_name["cc_with_payment.csv"].file_rec
+    parallel_rows = [(x.date, x.description, x.amount, x.is_payment, x.matcher_id, x.raw_row_number)
+                     for x in dataservice.get_transactions(pay_file)]
+    parallel_raw = dataservice.get_raw_rows(pay_file)
+    single = dataservice.reload_transactions(pay_file.import_source_file)
+    assert parallel_rows == [(x.date, x.description, x.amount, x.is_payment, x.matcher_id,
+                              x.raw_row_number) for x in dataservice.get_transactions(single)]
+    assert dataservice.get_raw_rows(single) == parallel_raw
+    assert dataservice.get_status().file_rows[single.id] == (1, 2)
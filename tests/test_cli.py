@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+from pathlib import Path
+import json
+import shutil
+import subprocess
+import sys
+
+from ctrack.cli import main
+from ctrack.flow import MainFlow
+
+
+def test_cli(capsys, tmp_path):
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+
+    base = ['-d', str(data_dir), '-g', str(data_dir / "test.gnucash")]
+    assert main(base + ['import', str(data_dir / "cc_with_payment.csv")]) == 0
+    assert main(base + ['rematch', '--matchers', str(data_dir / "matcher_map.csv")]) == 0
+    capsys.readouterr()
+    assert main(base + ['status', '--json']) == 0
+    status = json.loads(capsys.readouterr().out)
+    assert status['pending_files'] == 1
+    assert status['next_step'] == "add_matcher_rule"
+
+    # unmatched rows stop the export
+    out_dir = tmp_path / "out"
+    assert main(base + ['export', '--output-dir', str(out_dir)]) == 1
+    MainFlow(data_dir).add_matcher_rule(regexp="^kindle", no_case=True,
+                                        account_name="Expenses:books:on_line")
+    assert main(base + ['export', '--output-dir', str(out_dir)]) == 0
+    assert (out_dir / "cc_with_payment_standard.csv").exists()
+    # errors go to stderr with a failing exit code
+    assert main(base + ['export', '--output-dir', str(out_dir), '--include-payments']) == 1
+    assert "--payments-account" in capsys.readouterr().err
+    assert main(base + ['export', '--output-dir', str(out_dir), '--include-payments',
+                        '--payments-account', "Assets:Checking"]) == 0
+
+    # the book path is remembered, and without -g status does not pay for piecash or nicegui
+    code = ("import sys; from ctrack.cli import main; main(sys.argv[1:]); "
+            "assert 'piecash' not in sys.modules and 'nicegui' not in sys.modules")
+    result = subprocess.run([sys.executable, '-c', code, '-d', str(data_dir), 'status'],
+                            cwd=Path(__file__).parent.parent / "src", capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
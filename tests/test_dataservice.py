@@ -4,10 +4,12 @@ import json
 import csv
 import re
 import shutil
+from datetime import date
 from decimal import Decimal
 import pytest
 
-from ctrack.data_service import DataService
+from ctrack.data_service import DataService, EngineProfile, HeaderSignature
+from ctrack.data_service import ColumnMapIndex, choose_column_map, header_signature
 
     
 def test_data_service():
@@ -76,7 +78,20 @@ def test_data_service():
             kindle_row = xact
     
     assert one_miss_file.rows_matched() == (1,1)
+    status = dataservice.get_status()
+    assert status.pending_files == 1
+    assert status.mapped_files == 1
+    assert status.unmapped_files == 0
+    assert (status.matched_rows, status.unmatched_rows) == (1, 1)
+    assert status.file_rows[one_miss_file.id] == (1, 1)
+    assert len(status.missing_accounts) == 3
+    assert status.unsynced_accounts == []
     
+    # Both rows block saving, one has no matcher, the other's account is missing
+    assert not one_miss_file.is_save_ready()
+    all_ids = sorted(x.id for x in dataservice.get_transactions(one_miss_file))
+    assert dataservice.get_save_readiness() == {one_miss_file.id: all_ids}
+
     # Make sure it bitches when we try to convert an unfinished file
     with pytest.raises(Exception):
         dataservice.standardize_transactions(one_miss_file)
@@ -113,6 +128,8 @@ def test_data_service():
         assert accnt is not None
         assert accnt.in_gnucash
     assert matcher.account_status(dataservice) == (True, True)
+    assert dataservice.get_save_readiness([one_miss_file.id]) == {one_miss_file.id: []}
+    assert one_miss_file.is_save_ready()
 
     # 8. Make "standardized" importable transactions file
     output_data = dataservice.standardize_transactions(one_miss_file)
@@ -177,3 +194,124 @@ def test_data_service():
     assert balances['Expenses:books:on_line'] == Decimal('12.98')
     assert balances['Expenses:groceries:heb:online_groceries'] == Decimal('151.84')
             
+
+
+def test_engine_profile():
+
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+
+    def pragmas(dataservice):
+        with dataservice.engine.connect() as conn:
+            return {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                    for name in ("journal_mode", "synchronous", "cache_size",
+                                 "mmap_size", "temp_store")}
+
+    dataservice = DataService(data_dir)
+    assert pragmas(dataservice) == {"journal_mode": "wal", "synchronous": 1,
+                                    "cache_size": -64000, "mmap_size": 256 * 1024 * 1024,
+                                    "temp_store": 2}
+    assert dataservice.engine.pool.__class__.__name__ == "QueuePool"
+
+    profile = EngineProfile(synchronous="FULL", cache_size=-2000, mmap_size=0,
+                            temp_store="DEFAULT", pool="null")
+    dataservice = DataService(data_dir, profile)
+    assert pragmas(dataservice) == {"journal_mode": "wal", "synchronous": 2,
+                                    "cache_size": -2000, "mmap_size": 0,
+                                    "temp_store": 0}
+    assert dataservice.engine.pool.__class__.__name__ == "NullPool"
+
+
+def test_report_totals():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    dataservice = DataService(data_dir)
+    dataservice.load_matcher_file(data_dir / "matcher_map.csv")
+    pay_file = dataservice.load_transactions(data_dir / "cc_with_payment.csv")
+    miss_file = dataservice.load_transactions(data_dir / "cc_one_match_one_miss.csv")
+
+    def totals(*args, **kwargs):
+        return {r.key: (r.count, r.total) for r in dataservice.report_totals(*args, **kwargs)}
+
+    heb = 'Expenses:groceries:heb:online_groceries'
+    assert totals() == {None: (3, Decimal('138.86')), heb: (2, Decimal('-303.68'))}
+    assert totals("kind") == {"charge": (4, Decimal('-329.64')), "payment": (1, Decimal('164.82'))}
+    assert totals("month") == {"2025-07": (1, Decimal('164.82')), "2025-08": (4, Decimal('-329.64'))}
+    assert totals("file") == {pay_file.id: (3, Decimal('0.00')), miss_file.id: (2, Decimal('-164.82'))}
+    assert totals(("file", "kind"))[(pay_file.id, "payment")] == (1, Decimal('164.82'))
+
+    assert totals("kind", start_date=date(2025, 8, 1)) == {"charge": (4, Decimal('-329.64'))}
+    assert totals("kind", end_date=date(2025, 7, 31)) == {"payment": (1, Decimal('164.82'))}
+    assert totals(file_ids=[miss_file.id]) == {None: (1, Decimal('-12.98')), heb: (1, Decimal('-151.84'))}
+
+    with pytest.raises(Exception):
+        dataservice.report_totals("week")
+
+
+def test_header_signatures():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    with open(data_dir / "other_bank.csv", 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["When", "What", "How Much"])
+        writer.writerow(["2025-08-02", "HEB ONLINE #108", "-151.84"])
+
+    assert header_signature(["a", "b", "a"]) == header_signature(["b", "a"])
+    assert header_signature(["a", "b"]) != header_signature(["a", "b", "c"])
+
+    dataservice = DataService(data_dir)
+    cmaps = dataservice.get_column_maps()
+    index = ColumnMapIndex(cmaps)
+
+    def map_id(cmap):
+        return cmap.id if cmap is not None else None
+
+    for header in (["Posted Date", "Payee", "Amount"], ["Date", "Payee", "Amount"],
+                   ["Amount", "Payee", "Posted Date", "Extra"], [], ["Posted Date"]):
+        expected = map_id(choose_column_map(sorted(cmaps, key=lambda c: c.id), header))
+        assert map_id(index.choose(header)) == expected
+        # second lookup comes from the signature cache
+        assert map_id(index.choose(header)) == expected
+
+    no_map = dataservice.load_transactions(data_dir / "cc_no_col_map.csv")
+    other = dataservice.load_transactions(data_dir / "other_bank.csv")
+    mapped = dataservice.load_transactions(data_dir / "cc_with_payment.csv")
+    assert not no_map.columns_mapped and not other.columns_mapped and mapped.columns_mapped
+    assert no_map.header_signature == header_signature(["Date", "Reference Number", "Payee",
+                                                        "Address", "Amount"])
+    # a second file with a known header is mapped from the recorded signature
+    dataservice.column_map_index = None
+    again = dataservice.load_transactions(data_dir / "cc_one_match_one_miss.csv")
+    assert again.column_map_id == mapped.column_map_id
+
+    # only the file whose header the new map fits is offered for remapping
+    cmap = dataservice.add_column_map('map2', "Date", "Payee", "Amount", "%m/%d/%Y")
+    assert [f.id for f in dataservice.get_files_for_column_map(cmap)] == [no_map.id]
+    remapped = dataservice.remap_transactions(no_map)
+    assert remapped.column_map_id == cmap.id
+    assert len(dataservice.get_transactions(remapped)) == 1
+    assert dataservice.get_files_for_column_map(cmap) == []
+    with dataservice.Session() as session:
+        recorded = {h.signature: h.column_map_id for h in session.query(HeaderSignature)}
+    assert recorded[no_map.header_signature] == cmap.id
+    assert recorded[other.header_signature] is None
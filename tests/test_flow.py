@@ -58,9 +58,16 @@ def test_full_flow():
     # It is possible to create a matcher "manually" which will be
     # the typical method when a UI is driving the flow code. User
     # looks at the data and creates a new matcher for it. Simulate that.
+    # The new rule is applied to the unmatched rows in place, the
+    # file is not re-imported.
+    x_file = flow.pending_xaction_files[0]
+    xact_ids = [x.id for x in flow.dataservice.get_transactions(x_file)]
     account_name = "Expenses:books:on_line"
     matcher = flow.add_matcher_rule(regexp="^kindle", no_case=True, account_name=account_name)
     assert DataNeeded.MATCHER_RULE not in flow.get_data_needs()
+    xacts = flow.dataservice.get_transactions(flow.pending_xaction_files[0])
+    assert [x.id for x in xacts] == xact_ids
+    assert all(x.matcher_id == matcher.id for x in xacts)
 
     # If the loaded file has all rows matched by some known matcher,
     # but the any matcher refers to an account that does not exist in
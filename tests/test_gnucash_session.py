@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+from pathlib import Path
+import shutil
+from decimal import Decimal
+import pytest
+from piecash import open_book
+
+from ctrack.data_service import DataService, extract_gnucash_accounts
+from ctrack.flow import MainFlow
+
+
+def test_gnucash_session():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    dataservice = DataService(data_dir)
+    dataservice.set_gnucash_file(data_dir / "test.gnucash")
+
+    names = ["Expenses:books:on_line", "Expenses:groceries:heb:online_groceries"]
+    for name in names:
+        dataservice.add_account(name, f"Test batch account {name}")
+
+    def book_names():
+        return [rec['name'] for rec in extract_gnucash_accounts(data_dir / "test.gnucash")]
+
+    # An error inside the batch rolls back every change and leaves the
+    # local accounts marked as not in gnucash.
+    with pytest.raises(ZeroDivisionError):
+        with dataservice.open_gnucash_session():
+            for name in names:
+                dataservice.save_account(name)
+            1 / 0
+    assert dataservice.gnucash_session is None
+    for name in names:
+        assert name not in book_names()
+        assert not dataservice.get_account(name).in_gnucash
+
+    # Only one session at a time
+    with dataservice.open_gnucash_session() as gc_session:
+        with pytest.raises(Exception):
+            dataservice.open_gnucash_session()
+        for name in names:
+            dataservice.save_account(name)
+        # nothing is written until the batch commits
+        assert not dataservice.get_account(names[0]).in_gnucash
+        assert names[0] not in book_names()
+    for name in names:
+        assert name in book_names()
+        assert dataservice.get_account(name).in_gnucash
+
+
+def test_batch_post():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    flow = MainFlow(data_dir, data_dir / "test.gnucash")
+    flow.add_column_map('map2', "Date", "Payee", "Amount", "%m/%d/%Y")
+    flow.load_matcher_rules_file(data_dir / "matcher_map.csv")
+    flow.add_matcher_rule(regexp="^kindle", no_case=True, account_name="Expenses:books:on_line")
+    flow.add_xaction_file(data_dir / "cc_no_col_map.csv")
+    flow.add_xaction_file(data_dir / "cc_one_match_one_miss.csv")
+    for name in flow.get_missing_accounts()[0]:
+        flow.add_account(name=name, description=f"Test batch account {name}")
+    flow.dataservice.update_gnucash_accounts()
+    flow.dataservice.load_gnucash_file()
+    ready = flow.get_savable_xactions()
+    assert len(ready) == 2
+    payments_account = 'Assets:Checking:PendingChecks'
+
+    # a bad account name on the second file stops the whole batch
+    with pytest.raises(Exception):
+        flow.save_xactions("Liabilities:MC1", payments_account,
+                           cc_account_names={ready[1].id: "Liabilities:NoSuchCard"})
+    assert len(flow.get_savable_xactions()) == 2
+    book_path = str(data_dir / "test.gnucash")
+    with open_book(book_path) as book:
+        assert book.accounts(fullname="Liabilities:MC1").get_balance() == Decimal('0.00')
+
+    deltas = flow.save_xactions("Liabilities:MC1", payments_account)
+    assert len(flow.get_savable_xactions()) == 0
+    by_name = {x_file.id: x_file for x_file in ready}
+    for file_id, file_deltas in deltas.items():
+        if by_name[file_id].import_source_file.endswith("cc_no_col_map.csv"):
+            assert file_deltas == {"Liabilities:MC1": Decimal('12.98'),
+                                   "Expenses:books:on_line": Decimal('12.98')}
+        else:
+            assert file_deltas["Liabilities:MC1"] == Decimal('164.82')
+            assert file_deltas["Expenses:groceries:heb:online_groceries"] == Decimal('151.84')
+    with open_book(book_path) as book:
+        assert book.accounts(fullname="Liabilities:MC1").get_balance() == Decimal('177.80')
+
+
+def test_account_sync():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    book_path = data_dir / "test.gnucash"
+    dataservice = DataService(data_dir)
+    dataservice.set_gnucash_file(book_path)
+    recs = extract_gnucash_accounts(book_path)
+    assert dataservice.accounts_count() == len(recs)
+    dataservice.add_account("Expenses:local_only", "Not saved to the book yet")
+
+    # an unchanged book is not read again
+    assert dataservice.load_gnucash_file() is False
+
+    # a change in the book is applied as a diff
+    with open_book(str(book_path), readonly=False, do_backup=False) as book:
+        book.accounts(fullname=recs[0]['name']).description = "Changed in GnuCash"
+        book.save()
+    assert dataservice.load_gnucash_file() == (0, 1, 0)
+    assert dataservice.get_account(recs[0]['name']).description == "Changed in GnuCash"
+    assert dataservice.load_gnucash_file() is False
+
+    changed = recs[1:] + [dict(name="Expenses:new_in_book", description="")]
+    assert dataservice.load_accounts(changed) == (1, 0, 1)
+    assert dataservice.get_account(recs[0]['name']) is None
+    assert dataservice.get_account("Expenses:new_in_book").in_gnucash
+    # loading accounts from elsewhere clears the stamp, so the book is read again
+    assert dataservice.load_gnucash_file() == (1, 0, 1)
+    # forcing reads the book whatever the stamp, and local accounts survive
+    assert dataservice.load_gnucash_file(force=True) == (0, 0, 0)
+    assert dataservice.get_account("Expenses:new_in_book") is None
+    assert not dataservice.get_account("Expenses:local_only").in_gnucash
+    assert dataservice.accounts_count() == len(recs) + 1
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+from pathlib import Path
+import shutil
+import pytest
+
+from ctrack import data_service, jobs
+from ctrack.data_service import DataService, EngineProfile
+from ctrack.jobs import JobManager, Job, JobCancelled
+
+
+def test_jobs(monkeypatch):
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    # one row per batch, so there is a boundary after every row
+    monkeypatch.setattr(data_service, "RAW_PAGE_SIZE", 1)
+    dataservice = DataService(data_dir)
+    dataservice.load_matcher_file(data_dir / "matcher_map.csv")
+    manager = JobManager(dataservice)
+    seen = []
+    manager.subscribe(lambda job: seen.append((job.state, job.rows_done)))
+
+    job = manager.submit("load_transactions", dataservice.load_transactions,
+                         data_dir / "cc_with_payment.csv", description="import")
+    file_rec = job.wait(10)
+    assert job.state == Job.DONE
+    assert job.result is file_rec
+    assert (job.rows_done, job.rows_total) == (3, 3)
+    # the total grows page by page as the raw rows are read, ahead of the rows done
+    assert [rows for state, rows in seen if state == Job.RUNNING] == [0, 0, 1, 1, 2, 2, 3]
+    assert seen[-1] == (Job.DONE, 3)
+
+    # cancelled at the first batch boundary, nothing is kept
+    def cancel_early(job):
+        if job.rows_done >= 1:
+            job.cancel()
+    manager.subscribe(cancel_early)
+    job = manager.submit("load_transactions", dataservice.load_transactions,
+                         data_dir / "cc_one_match_one_miss.csv", description="cancel me")
+    with pytest.raises(JobCancelled):
+        job.wait(10)
+    manager.unsubscribe(cancel_early)
+    assert job.state == Job.CANCELLED
+    assert len(dataservice.get_transaction_files()) == 1
+
+    # a failure is recorded with its error
+    job = manager.submit("load_transactions", dataservice.load_transactions,
+                         data_dir / "no_such_file.csv")
+    with pytest.raises(Exception):
+        job.wait(10)
+    assert job.state == Job.FAILED
+
+    history = manager.history()
+    assert [(rec.kind, rec.state) for rec in history] == [
+        ("load_transactions", Job.FAILED),
+        ("load_transactions", Job.CANCELLED),
+        ("load_transactions", Job.DONE)]
+    assert history[2].rows_done == 3 and history[2].finished is not None
+    assert "no_such_file" in history[0].error
+
+    # a job left running by a stopped process is failed on startup
+    stale = Job(manager, "do_cc_transactions", "stale")
+    stale.state = Job.RUNNING
+    dataservice.save_job(stale)
+    manager.shutdown()
+    manager = JobManager(dataservice)
+    rec = manager.history(1)[0]
+    assert (rec.id, rec.state, rec.error) == (stale.id, Job.FAILED, "interrupted")
+    manager.shutdown()
+
+
+def test_job_progress_during_import(monkeypatch):
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    with open(data_dir / "cc_big.csv", "w") as f:
+        f.write("Posted Date,Reference Number,Payee,Address,Amount\n")
+        for i in range(2000):
+            f.write(f'08/02/2025,{i},"HEB ONLINE #{i}","",-1.{i % 100:02d}\n')
+    # progress is due at every page, and a write blocked by the import's
+    # open transaction gives up quickly rather than waiting it out
+    monkeypatch.setattr(jobs, "PROGRESS_SAVE_INTERVAL", 0)
+    monkeypatch.setattr(data_service, "RAW_PAGE_SIZE", 100)
+    dataservice = DataService(data_dir, EngineProfile(busy_timeout=0.2))
+    manager = JobManager(dataservice)
+    try:
+        job = manager.submit("load_transactions", dataservice.load_transactions,
+                             data_dir / "cc_big.csv", description="big import")
+        file_rec = job.wait(60)
+        assert job.state == Job.DONE
+        assert file_rec.rows_matched() == (0, 2000)
+        rec = manager.history(1)[0]
+        assert (rec.id, rec.state, rec.rows_done, rec.rows_total) == (job.id, Job.DONE, 2000, 2000)
+    finally:
+        manager.shutdown()
+
+
+def test_cancel_import_directory(monkeypatch):
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    for i in range(4):
+        with open(data_dir / f"cc_many_{i}.csv", "w") as f:
+            f.write("Posted Date,Reference Number,Payee,Address,Amount\n")
+            for j in range(5):
+                f.write(f'08/02/2025,{i}-{j},"HEB ONLINE #{i}","",-1.{j:02d}\n')
+    monkeypatch.setattr(data_service, "RAW_PAGE_SIZE", 1)
+    dataservice = DataService(data_dir)
+    manager = JobManager(dataservice)
+
+    def cancel_early(job):
+        if job.rows_done >= 1:
+            job.cancel()
+    manager.subscribe(cancel_early)
+    try:
+        job = manager.submit("import_directory", dataservice.import_directory, data_dir,
+                             "cc_many_*.csv", 1, description="cancel me")
+        with pytest.raises(JobCancelled):
+            job.wait(60)
+        assert job.state == Job.CANCELLED
+        # the file being stored was rolled back and no later file was stored
+        assert dataservice.get_transaction_files() == []
+        assert list(data_dir.glob("*.spool")) == []
+        assert manager.history(1)[0].state == Job.CANCELLED
+    finally:
+        manager.shutdown()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+from pathlib import Path
+import shutil
+import pytest
+
+from ctrack import data_service
+from ctrack.data_service import MatcherRule, MatcherEngine, DataService, DescriptionMatch
+
+
+def loop_match(rules, desc):
+    for m in sorted(rules, key=lambda r: r.id):
+        if m.compiled.match(desc):
+            return m.id
+    return None
+
+
+def test_matcher_engine():
+
+    specs = [
+        (1, "^amazon\\.com", True),
+        (2, "^amzn mktp", True),
+        (3, "^HEB", False),
+        (4, "^heb online", True),           # shadowed by rule 3 for upper case input
+        (5, "^(kindle) unltd.*\\1", True),  # own group and back reference, standalone
+        (6, "^kindle", True),
+        (7, "(?i)^netflix", False),         # global inline flag, standalone
+        (8, "^net", False),
+        (9, "^shell|^exxon", True),
+    ]
+    rules = [MatcherRule(id=rid, regexp=regexp, no_case=no_case, account_name=f"Expenses:r{rid}")
+             for rid, regexp, no_case in specs]
+    # insertion order must not matter, only id order
+    engine = MatcherEngine(list(reversed(rules)))
+
+    descs = ["AMAZON.COM*1234", "Amzn Mktp US", "HEB ONLINE #108", "heb online #108",
+             "Kindle Unltd*kindle", "Kindle Unltd*12345678", "NETFLIX.COM", "net stuff",
+             "Exxon 12", "SHELL OIL", "unknown merchant", ""]
+    for desc in descs:
+        assert engine.match(desc) == loop_match(rules, desc), desc
+
+    assert engine.match("HEB ONLINE #108") == 3
+    assert engine.match("heb online #108") == 4
+    assert engine.match("Kindle Unltd*12345678") == 6
+    assert engine.match("NETFLIX.COM") == 7
+    assert engine.match("unknown merchant") is None
+
+    assert MatcherEngine([]).match("anything") is None
+
+
+def test_matcher_memo(monkeypatch):
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    dataservice = DataService(data_dir)
+    dataservice.load_matcher_file(data_dir / "matcher_map.csv")
+    file_rec = dataservice.load_transactions(data_dir / "cc_with_payment.csv")
+
+    def stored():
+        with dataservice.Session() as session:
+            return {d.description: d.matcher_id for d in session.query(DescriptionMatch)}
+
+    descs = [x.description for x in dataservice.get_transactions(file_rec)]
+    heb_id = dataservice.get_transactions(file_rec)[0].matcher_id
+    assert heb_id is not None
+    assert stored() == {descs[0]: heb_id, descs[1]: None, descs[2]: None}
+
+    # a new rule updates only the remembered descriptions it now wins for
+    rule = dataservice.add_matcher("^kindle", True, "Expenses:books:on_line")
+    expected = {descs[0]: heb_id, descs[1]: rule.id, descs[2]: None}
+    assert stored() == expected
+    assert dict(dataservice.matcher_memo.entries) == expected
+
+    # a new DataService starts from the stored memo, and repeat
+    # descriptions never reach the regexp engine
+    dataservice = DataService(data_dir)
+    assert dict(dataservice.get_matcher().entries) == expected
+
+    def no_regexp(self, desc):
+        raise Exception(f"regexp search for {desc}")
+    monkeypatch.setattr(MatcherEngine, "match", no_regexp)
+    file_rec = dataservice.reload_transactions(data_dir / "cc_with_payment.csv")
+    assert [x.matcher_id for x in dataservice.get_transactions(file_rec)] == [heb_id, rule.id, None]
+    monkeypatch.undo()
+
+    # bounded, least recently used descriptions are dropped
+    monkeypatch.setattr(data_service, "MATCHER_MEMO_SIZE", 2)
+    dataservice = DataService(data_dir)
+    dataservice.reload_transactions(data_dir / "cc_one_match_one_miss.csv")
+    assert len(dataservice.matcher_memo.entries) == 2
+    assert set(stored()) == set(dataservice.matcher_memo.entries)
+
+
+def test_matcher_memo_shared():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    first = DataService(data_dir)
+    first.load_matcher_file(data_dir / "matcher_map.csv")
+    file_rec = first.load_transactions(data_dir / "cc_with_payment.csv")
+    heb_id = first.get_transactions(file_rec)[0].matcher_id
+    assert [x.matcher_id for x in first.get_transactions(file_rec)] == [heb_id, None, None]
+
+    # a rule added through another DataService, as the CLI would
+    rule = DataService(data_dir).add_matcher("^kindle", True, "Expenses:books:on_line")
+    file_rec = first.reload_transactions(data_dir / "cc_with_payment.csv")
+    assert [x.matcher_id for x in first.get_transactions(file_rec)] == [heb_id, rule.id, None]
+
+    # and the stored memo was not overwritten with the old results
+    fresh = DataService(data_dir)
+    file_rec = fresh.reload_transactions(data_dir / "cc_with_payment.csv")
+    assert [x.matcher_id for x in fresh.get_transactions(file_rec)] == [heb_id, rule.id, None]
+    descs = [x.description for x in fresh.get_transactions(file_rec)]
+    with fresh.Session() as session:
+        stored = {d.description: d.matcher_id for d in session.query(DescriptionMatch)}
+    assert stored == {descs[0]: heb_id, descs[1]: rule.id, descs[2]: None}
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+from pathlib import Path
+import shutil
+import pytest
+
+from ctrack.flow import MainFlow
+from ctrack.metrics import metrics
+
+
+def test_metrics():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+
+    metrics.reset()
+    flow = MainFlow(data_dir, data_dir / "test.gnucash")
+    # nothing recorded until enabled
+    flow.add_xaction_file(data_dir / "cc_with_payment.csv")
+    assert metrics.snapshot() == []
+
+    metrics.enable()
+    try:
+        flow.load_matcher_rules_file(data_dir / "matcher_map.csv")
+        flow.add_matcher_rule(regexp="^kindle", no_case=True, account_name="Expenses:books:on_line")
+        flow.get_next_step()
+        flow.get_next_step()
+        with pytest.raises(Exception):
+            flow.dataservice.report_totals("week")
+    finally:
+        metrics.disable()
+    flow.get_next_step()
+
+    ops = {stats.name: stats for stats in metrics.snapshot()}
+    assert ops["MainFlow.get_next_step"].calls == 2
+    assert ops["DataService.get_status"].calls == 2
+    assert ops["DataService.get_status"].sql_statements > 0
+    assert sum(ops["DataService.get_status"].buckets) == 2
+    # nested calls count toward the outer call too
+    assert ops["MainFlow.get_next_step"].sql_statements >= ops["DataService.get_status"].sql_statements
+    # two rules added one after the other, each scanning what was unmatched
+    assert ops["DataService.match_unmatched_transactions"].calls == 2
+    assert ops["DataService.match_unmatched_transactions"].rows == 3 + 2
+    assert ops["DataService.report_totals"].errors == 1
+
+    text = metrics.render_text()
+    assert 'ctrack_calls_total{op="MainFlow.get_next_step"} 2' in text
+    assert 'ctrack_call_seconds_bucket{op="DataService.get_status",le="+Inf"} 2' in text
+    metrics.reset()
+    assert metrics.snapshot() == []
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+from datetime import datetime
+from decimal import Decimal
+import pytest
+
+from ctrack.data_service import ColumnMap, RowParser, cents_to_decimal
+
+
+def make_parser(date_format):
+    cmap = ColumnMap(id=1, date_column="Date", date_format=date_format,
+                     description_column="Description", amount_column="Amount")
+    return RowParser(cmap)
+
+
+def test_row_parser_dates():
+
+    cases = {
+        "%m/%d/%Y": ["01/02/2023", "1/2/2023", "12/31/1999", "02/29/2024"],
+        "%Y-%m-%d": ["2023-01-02", "1999-12-31", "2024-2-9"],
+        "%d.%m.%y": ["02.01.23", "31.12.99", "01.01.68", "01.01.69"],
+        "%b %d %Y": ["Jan 02 2023"],
+    }
+    for fmt, texts in cases.items():
+        parser = make_parser(fmt)
+        for text in texts:
+            assert parser.parse_date(text) == datetime.strptime(text, fmt), (fmt, text)
+            # memoised value is the same
+            assert parser.parse_date(text) == datetime.strptime(text, fmt), (fmt, text)
+
+    assert make_parser("%m/%d/%Y").split_date
+    assert not make_parser("%b %d %Y").split_date
+    assert not make_parser("%m/%d/%Y %H:%M").split_date
+
+    # bad input fails the same way strptime does
+    parser = make_parser("%m/%d/%Y")
+    for bad in ["13/01/2023", "02/30/2023", "01/02/23", "1-2-2023", "ab/cd/efgh"]:
+        with pytest.raises(ValueError):
+            datetime.strptime(bad, "%m/%d/%Y")
+        with pytest.raises(ValueError):
+            parser.parse_date(bad)
+
+
+def test_row_parser_amounts():
+
+    parser = make_parser("%m/%d/%Y")
+    for text in ["12.34", "-12.34", "+5.00", "0.00", "-0.50", ".99", "-.01",
+                 "1234567.89", "7", "-7", "12.3", "12.345", "1e2", " 4.20 "]:
+        expected = Decimal(text)
+        cents, is_payment = parser.parse_amount(text)
+        assert cents == int(expected * 100), text
+        assert is_payment == (expected > 0), text
+        if expected == expected.quantize(Decimal("0.01")):
+            assert cents_to_decimal(cents) == expected, text
+
+    with pytest.raises(Exception):
+        parser.parse_amount("twelve")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+from pathlib import Path
+import shutil
+import sqlite3
+import pytest
+
+from ctrack.data_service import header_signature
+from ctrack.flow import MainFlow
+
+
+def test_baseline_db():
+
+    pull_dir = Path(__file__).parent / "prep_data" / "test_full_flow"
+    data_dir = Path(__file__).parent / "target"
+    if not data_dir.exists():
+        data_dir.mkdir()
+    else:
+        for item in data_dir.glob("*"):
+            item.unlink()
+    for item in pull_dir.glob("*"):
+        shutil.copy(item, data_dir)
+    # a ctrack.db written by the first release, with one mapped and one
+    # unmapped file and their raw rows stored as JSON
+    dump = (Path(__file__).parent / "prep_data" / "baseline_db" / "ctrack.sql").read_text()
+    conn = sqlite3.connect(data_dir / "ctrack.db")
+    conn.executescript(dump.replace("DATA_DIR", str(data_dir)))
+    conn.close()
+
+    flow = MainFlow(data_dir)
+    dataservice = flow.dataservice
+    files = dataservice.get_transaction_files()
+    assert [f.columns_mapped for f in files] == [True, False]
+    assert files[0].content_hash is None
+    assert files[0].header_signature == header_signature(
+        ["Posted Date", "Reference Number", "Payee", "Address", "Amount"])
+    assert files[0].rows_matched() == (1, 2)
+    # raw rows stored as JSON were moved into raw pages
+    rows = dataservice.get_raw_rows(files[1])
+    assert [row["Payee"] for row in rows] == ["Kindle Unltd*12345678 888-802-3080 WA"]
+    status = dataservice.get_status()
+    assert status.pending_files == 2
+    assert status.unmapped_files == 1
+
+    # the accounts were loaded before stamps were kept, so the first sync reads the book
+    assert dataservice.load_gnucash_file() is not False
+    assert dataservice.load_gnucash_file() is False
+
+    # a file with no recorded hash is replaced when imported again
+    file_rec = dataservice.load_transactions(data_dir / "cc_with_payment.csv")
+    assert file_rec.id != files[0].id
+    assert file_rec.content_hash is not None
+    assert dataservice.load_transactions(data_dir / "cc_with_payment.csv").id == file_rec.id
+
+    # the unmapped file is remapped from its converted rows
+    flow.add_column_map('map2', "Date", "Payee", "Amount", "%m/%d/%Y")
+    unmapped = dataservice.get_transaction_files()[0]
+    assert unmapped.id == files[1].id
+    assert unmapped.columns_mapped
+    assert unmapped.rows_matched() == (0, 1)
+
+    # a file whose raw data is gone is never mapped empty
+    conn = sqlite3.connect(data_dir / "ctrack.db")
+    conn.execute("DELETE FROM cc_raw_transactions WHERE file_id = ?", (unmapped.id,))
+    conn.execute("DELETE FROM cc_raw_row_pages WHERE file_id = ?", (unmapped.id,))
+    conn.execute("UPDATE cc_transaction_files SET column_map_id = NULL WHERE id = ?", (unmapped.id,))
+    conn.commit()
+    conn.close()
+    with pytest.raises(Exception):
+        dataservice.remap_transactions(unmapped)
+    unmapped = dataservice.get_transaction_files()[0]
+    assert not unmapped.columns_mapped
+    assert unmapped.rows_matched() == (0, 1)
+
+    # a header only statement is valid, it maps with no transactions and
+    # does not stop the files after it from being mapped
+    with open(data_dir / "empty.csv", "w") as f:
+        f.write("Day,Merchant,Value\n")
+    with open(data_dir / "one.csv", "w") as f:
+        f.write("Day,Merchant,Value\n")
+        f.write('08/02/2025,"HEB ONLINE #108",-1.00\n')
+    empty = dataservice.load_transactions(data_dir / "empty.csv")
+    one = dataservice.load_transactions(data_dir / "one.csv")
+    assert not empty.columns_mapped and not one.columns_mapped
+    flow.add_column_map('map3', "Day", "Merchant", "Value", "%m/%d/%Y")
+    by_id = {f.id: f for f in dataservice.get_transaction_files()}
+    assert by_id[empty.id].columns_mapped
+    assert by_id[empty.id].rows_matched() == (0, 0)
+    assert by_id[one.id].columns_mapped
+    assert by_id[one.id].rows_matched() == (1, 0)